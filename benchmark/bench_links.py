@@ -0,0 +1,83 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+
+Compare link extractor backends on simple index pages.
+
+Record pages to compare with, for example::
+
+  curl -o boto3.html https://pypi.org/simple/boto3/
+  python benchmark/bench_links.py boto3.html numpy.html
+
+Without argument a synthetic page shaped like a PyPI simple page is used.
+"""
+import argparse
+import hashlib
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from typi_proxy.links import EXTRACTORS  # noqa
+
+
+def synthetic_page(name='example', files=5000):
+    lines = ['<!DOCTYPE html>',
+             '<html>',
+             '  <head>',
+             '    <meta name="pypi:repository-version" content="1.1">',
+             '    <title>Links for {}</title>'.format(name),
+             '  </head>',
+             '  <body>',
+             '    <h1>Links for {}</h1>'.format(name)]
+    for i in range(files):
+        filename = '{}-1.{}.{}-py3-none-any.whl'.format(name, i // 100, i % 100)
+        digest = hashlib.sha256(filename.encode()).hexdigest()
+        lines.append('    <a href="https://files.pythonhosted.org/packages/{0}/{1}/{2}/{3}#sha256={4}" '
+                     'data-requires-python="&gt;=3.8" data-dist-info-metadata="sha256={4}">{3}</a><br />'
+                     .format(digest[:2], digest[2:4], digest[4:], filename, digest))
+    lines += ['  </body>', '</html>']
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', 1)[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pages', nargs='*', help='recorded simple page(s)')
+    parser.add_argument('--files', type=int, default=5000, help='anchors on the synthetic page')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = [(Path(page).name, Path(page).read_text('utf-8', 'replace')) for page in args.pages]
+    if not pages:
+        pages = [('synthetic', synthetic_page(files=args.files))]
+
+    extractors = []
+    for name, extract in sorted(EXTRACTORS.items()):
+        try:
+            extract('<a href="x">x</a>')
+        except ImportError as e:
+            print('skip {}: {}'.format(name, e))
+            continue
+        extractors.append((name, extract))
+
+    for page_name, body in pages:
+        print('{} ({:,} byte(s))'.format(page_name, len(body)))
+
+        reference = None
+        for name, extract in extractors:
+            anchors = extract(body)
+            hrefs = [a.get('href') for a in anchors]
+            if reference is None:
+                reference = hrefs
+            elif hrefs != reference:
+                print('  {:6} result differ from {}'.format(name, extractors[0][0]))
+
+            best = min(timeit.repeat(lambda: extract(body), number=1, repeat=args.repeat))
+            print('  {:6} {:8.2f} ms  {:6} anchor(s)'.format(name, best * 1000, len(anchors)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+
+End to end benchmark of the proxy against a local fake upstream.
+
+The fake upstream (benchmark/upstream.py) and the proxy run in their own process, with a fresh
+cache, upload directory and metadata store. Scenarios run in order, later ones reuse what earlier
+ones stored:
+
+  simple-cold   /simple/<pkg>/ of packages never fetched, crawled from upstream
+  simple-warm   /simple/<pkg>/ of packages fetched by simple-cold
+  simple-root   /simple/
+  transload     /package/remote/ of files not cached yet
+  download      /package/cache/ of files stored by transload
+  upload        multipart upload to /pypi/
+
+Results are saved as JSON, give a previous result to compare with, for example::
+
+  python benchmark/bench_proxy.py --output before.json
+  python benchmark/bench_proxy.py --output after.json --baseline before.json
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+from collections import OrderedDict
+from datetime import datetime
+from itertools import cycle, islice
+from pathlib import Path
+from urllib.parse import urlencode
+
+import tornado.gen
+import tornado.ioloop
+import yaml
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+from driver import run_load
+from upstream import add_arguments, get_repository
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = ['simple-cold', 'simple-warm', 'simple-root', 'transload', 'download', 'upload']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def multipart(fields, boundary='typi-proxy-benchmark'):
+    lines = []
+    for name, value, filename in fields:
+        disposition = 'Content-Disposition: form-data; name="{}"'.format(name)
+        if filename:
+            disposition += '; filename="{}"'.format(filename)
+        lines += [b'--' + boundary.encode(), disposition.encode(), b'', value]
+    lines += [b'--' + boundary.encode() + b'--', b'']
+    return b'\r\n'.join(lines), 'multipart/form-data; boundary=' + boundary
+
+
+class Bench():
+    def __init__(self, args):
+        self.args = args
+        self.repository = get_repository(args)
+        self.base = Path(tempfile.mkdtemp(prefix='typi-bench-'))
+        self.upstream_url = 'http://127.0.0.1:{}'.format(free_port())
+        self.proxy_url = 'http://127.0.0.1:{}'.format(free_port())
+        self.processes = []
+
+    def write_config(self):
+        with (ROOT / 'typi_proxy' / 'template' / 'config.yml').open() as f:
+            cfg = yaml.safe_load(f)
+
+        cfg['server']['port'] = int(self.proxy_url.rpartition(':')[2])
+        cfg['server']['workers'] = self.args.workers
+        cfg['index']['base'] = self.upstream_url + '/simple/'
+        for name in ['cache', 'upload']:
+            (self.base / cfg['path'][name]).mkdir()
+
+        # access log would dominate the measure
+        cfg['logging']['root']['level'] = 'WARNING'
+        cfg['logging']['root']['handlers'] = ['file']
+
+        path = self.base / 'typi-proxy.yml'
+        with path.open('w') as f:
+            yaml.safe_dump(cfg, f)
+        return path
+
+    def start(self):
+        args = self.args
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get('PYTHONPATH')])))
+        log = (self.base / 'process.log').open('w')
+
+        self.processes.append(subprocess.Popen([
+            sys.executable, str(ROOT / 'benchmark' / 'upstream.py'),
+            '--port', self.upstream_url.rpartition(':')[2],
+            '--packages', str(args.packages), '--files', str(args.files), '--size', str(args.size),
+            '--seed', str(args.seed), '--latency', str(args.latency), '--bandwidth', str(args.bandwidth),
+        ], env=env, stdout=log, stderr=subprocess.STDOUT))
+
+        command = [sys.executable, '-m', 'typi_proxy.main', '--config', str(self.write_config()), 'start']
+        if importlib.util.find_spec('daemonocle') is not None:
+            command.append('--foreground')
+        self.processes.append(subprocess.Popen(command, cwd=str(self.base), env=env, stdout=log,
+                                               stderr=subprocess.STDOUT))
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+
+        if self.args.keep:
+            print('cache, upload and log kept in {}'.format(self.base))
+        else:
+            shutil.rmtree(str(self.base))
+
+    @tornado.gen.coroutine
+    def wait_ready(self, timeout=30):
+        client = AsyncHTTPClient(force_instance=True)
+        deadline = tornado.ioloop.IOLoop.current().time() + timeout
+        try:
+            for url in [self.upstream_url + '/simple/bench_0000/', self.proxy_url + '/metrics']:
+                while True:
+                    response = yield client.fetch(url, raise_error=False)
+                    if response.code == 200:
+                        break
+                    if tornado.ioloop.IOLoop.current().time() > deadline:
+                        raise Exception('{} not ready: {} see {}'.format(url, response.code, self.base))
+                    yield tornado.gen.sleep(0.2)
+        finally:
+            client.close()
+
+    def count(self, available):
+        return min(self.args.requests, available)
+
+    def request(self, path, **kwargs):
+        return HTTPRequest(self.proxy_url + path, request_timeout=600, **kwargs)
+
+    def simple_cold(self):
+        packages = self.repository.package_names()[:self.count(self.repository.packages)]
+        return [self.request('/simple/{}/'.format(name)) for name in packages]
+
+    def simple_warm(self):
+        packages = self.repository.package_names()[:self.count(self.repository.packages)]
+        return [self.request('/simple/{}/'.format(name)) for name in islice(cycle(packages), self.args.requests)]
+
+    def simple_root(self):
+        return [self.request('/simple/') for _ in range(self.args.requests)]
+
+    def files(self):
+        return self.repository.all_files()[:self.count(self.repository.packages * self.repository.files)]
+
+    def transload(self):
+        requests = []
+        for package_name, name in self.files():
+            link = '{}/files/{}#md5={}'.format(self.upstream_url, name, self.repository.md5(name))
+            requests.append(self.request('/package/remote/{}/{}?{}'.format(package_name, name,
+                                                                           urlencode({'link': link}))))
+        return requests
+
+    def download(self):
+        return [self.request('/package/cache/{}/{}'.format(package_name, name))
+                for package_name, name in islice(cycle(self.files()), self.args.requests)]
+
+    def upload(self):
+        requests = []
+        for i in range(self.args.requests):
+            name = 'bench_upload-1.{}.tar.gz'.format(i)
+            content = self.repository.content(name)
+            body, content_type = multipart([
+                (':action', b'file_upload', None),
+                ('name', b'bench_upload', None),
+                ('content', content, name),
+                ('md5_digest', hashlib.md5(content).hexdigest().encode(), None),
+            ])
+            requests.append(self.request('/pypi/', method='POST', body=body, headers={'Content-Type': content_type}))
+        return requests
+
+    @tornado.gen.coroutine
+    def run(self, scenarios):
+        yield self.wait_ready()
+
+        results = OrderedDict()
+        for scenario in scenarios:
+            requests = getattr(self, scenario.replace('-', '_'))()
+            if scenario == 'simple-warm' and 'simple-cold' not in results:
+                # fill the index cache first
+                yield run_load(self.simple_cold(), self.args.concurrency)
+            if scenario == 'download' and 'transload' not in results:
+                yield run_load(self.transload(), self.args.concurrency)
+
+            result = yield run_load(requests, self.args.concurrency)
+            results[scenario] = result
+            print_result(scenario, result)
+        return results
+
+
+def print_result(scenario, result, baseline=None):
+    latency = result['latency_ms']
+    line = '{:12} {:6} req {:4} err {:9.1f} req/s {:8.2f} MiB/s  p50 {:8.2f} ms  p99 {:8.2f} ms'.format(
+        scenario, result['requests'], result['errors'], result['throughput'] or 0, result['mib_per_second'] or 0,
+        latency['p50'] or 0, latency['p99'] or 0)
+
+    if baseline is not None and baseline.get('throughput') and baseline['latency_ms'].get('p99'):
+        line += '  ({:+.1f}% req/s, {:+.1f}% p99)'.format(
+            (result['throughput'] / baseline['throughput'] - 1) * 100,
+            (latency['p99'] / baseline['latency_ms']['p99'] - 1) * 100)
+    print(line)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=str(ROOT),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', 1)[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='scenario to run, all by default')
+    parser.add_argument('--requests', type=int, default=200, help='requests of each scenario')
+    parser.add_argument('--concurrency', type=int, default=10, help='requests in flight')
+    parser.add_argument('--workers', type=int, default=1, help='proxy worker process(es)')
+    parser.add_argument('--output', default='bench_proxy.json', help='JSON file the results are saved to')
+    parser.add_argument('--baseline', help='JSON result of a previous run to compare with')
+    parser.add_argument('--keep', default=False, action='store_true', help='keep the proxy directory and log')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = [scenario for scenario in SCENARIOS if scenario in (args.scenario or SCENARIOS)]
+
+    bench = Bench(args)
+    bench.start()
+    try:
+        results = tornado.ioloop.IOLoop.current().run_sync(lambda: bench.run(scenarios))
+    finally:
+        bench.stop()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['scenarios']
+        print('\ncompared with {}'.format(args.baseline))
+        for scenario, result in results.items():
+            if scenario in baseline:
+                print_result(scenario, result, baseline[scenario])
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(),
+            'commit': git_commit(),
+            'settings': {key: value for key, value in sorted(vars(args).items())
+                         if key not in ('output', 'baseline', 'scenario', 'keep')},
+            'scenarios': results,
+        }, f, indent=2, sort_keys=True)
+    print('results saved to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+
+Load driver sending requests with a fixed number in flight and summarizing their latency.
+"""
+import math
+from time import time
+
+import tornado.gen
+from tornado.httpclient import AsyncHTTPClient
+
+
+def percentile(values, percent):
+    """Nearest rank percentile of sorted ``values``."""
+    if not values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(values)) - 1, 0)
+    return values[rank]
+
+
+def summarize(latencies, duration, errors, received, sent):
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        'requests': count,
+        'errors': errors,
+        'duration': round(duration, 3),
+        'throughput': round(count / duration, 2) if duration else None,
+        'received': received,
+        'sent': sent,
+        'mib_per_second': round((received + sent) / duration / 1024 / 1024, 2) if duration else None,
+        'latency_ms': {
+            'min': ms(latencies[0] if latencies else None),
+            'mean': ms(sum(latencies) / count if count else None),
+            'p50': ms(percentile(latencies, 50)),
+            'p90': ms(percentile(latencies, 90)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+@tornado.gen.coroutine
+def run_load(requests, concurrency):
+    """Send every ``HTTPRequest`` of ``requests`` keeping ``concurrency`` of them in flight.
+
+    Response with a status of 400 or more count as error, their latency is still recorded.
+    """
+    client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+    pending = iter(requests)
+    latencies = []
+    counts = {'errors': 0, 'received': 0, 'sent': 0}
+
+    @tornado.gen.coroutine
+    def worker():
+        for request in pending:
+            started = time()
+            response = yield client.fetch(request, raise_error=False)
+            latencies.append(time() - started)
+
+            if response.code >= 400:
+                counts['errors'] += 1
+            counts['received'] += len(response.body or b'')
+            counts['sent'] += len(request.body or b'')
+
+    started = time()
+    try:
+        yield [worker() for _ in range(concurrency)]
+    finally:
+        client.close()
+
+    return summarize(latencies, time() - started, counts['errors'], counts['received'], counts['sent'])
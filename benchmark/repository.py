@@ -0,0 +1,79 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+
+Synthetic package repository shared by the fake upstream and the load driver.
+
+Everything is derived from the constructor arguments, so two processes built with the same
+arguments agree on every package, file name, content and digest without exchanging data.
+"""
+import hashlib
+from functools import lru_cache
+
+
+class Repository():
+    """``packages`` project(s) of ``files`` file(s) of ``size`` byte(s) each."""
+
+    def __init__(self, packages=100, files=20, size=256 * 1024, seed=0):
+        self.packages = packages
+        self.files = files
+        self.size = size
+        self.seed = seed
+
+    def settings(self):
+        return {'packages': self.packages, 'files': self.files, 'size': self.size, 'seed': self.seed}
+
+    def package_names(self):
+        # already normalized, proxy path and upstream path are the same
+        return ['bench_{:04d}'.format(i) for i in range(self.packages)]
+
+    def file_names(self, package_name):
+        names = []
+        for i in range(self.files):
+            if i % 2:
+                names.append('{}-1.{}-py3-none-any.whl'.format(package_name, i))
+            else:
+                names.append('{}-1.{}.tar.gz'.format(package_name, i))
+        return names
+
+    def all_files(self):
+        """Return ``(package, name)`` of every file, one of each package in turn."""
+        files = [[(package_name, name) for name in self.file_names(package_name)]
+                 for package_name in self.package_names()]
+        return [entry for entries in zip(*files) for entry in entries]
+
+    def package_of(self, name):
+        return name.partition('-')[0]
+
+    def __contains__(self, package_name):
+        if not package_name.startswith('bench_') or not package_name[6:].isdigit():
+            return False
+        return int(package_name[6:]) < self.packages
+
+    def has_file(self, name):
+        package_name = self.package_of(name)
+        return package_name in self and name in self.file_names(package_name)
+
+    @lru_cache(maxsize=64)
+    def content(self, name):
+        block = hashlib.sha256('{}:{}'.format(self.seed, name).encode()).digest() * 32
+        return (block * (self.size // len(block) + 1))[:self.size]
+
+    @lru_cache(maxsize=None)
+    def md5(self, name):
+        return hashlib.md5(self.content(name)).hexdigest()
+
+    def page(self, package_name, files_url):
+        """Simple index page of ``package_name`` linking to ``files_url``."""
+        lines = ['<!DOCTYPE html>',
+                 '<html>',
+                 '  <head>',
+                 '    <title>Links for {}</title>'.format(package_name),
+                 '  </head>',
+                 '  <body>',
+                 '    <h1>Links for {}</h1>'.format(package_name)]
+        for name in self.file_names(package_name):
+            lines.append('    <a href="{0}{1}#md5={2}">{1}</a><br />'.format(files_url, name, self.md5(name)))
+        lines += ['  </body>', '</html>']
+        return '\n'.join(lines)
@@ -0,0 +1,109 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+
+Stand-in for the upstream simple index and file host, serving a synthetic repository.
+
+Each response is delayed by ``--latency`` and sent at ``--bandwidth`` KiB/s, for example::
+
+  python benchmark/upstream.py --port 8081 --latency 50 --bandwidth 1024
+
+then point ``index.base`` at ``http://127.0.0.1:8081/simple/``.
+"""
+import argparse
+
+import tornado.gen
+import tornado.ioloop
+import tornado.web
+
+from repository import Repository
+
+
+class UpstreamMixin():
+    def initialize(self, repository, latency, bandwidth):
+        self.repository = repository
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    @tornado.gen.coroutine
+    def send(self, body):
+        """Send ``body`` after the latency, at most ``bandwidth`` byte(s) per second."""
+        if self.latency:
+            yield tornado.gen.sleep(self.latency)
+
+        self.set_header('Content-Length', len(body))
+        if not self.bandwidth:
+            self.finish(body)
+            return
+
+        # 10 slice per second
+        chunk_size = max(self.bandwidth // 10, 1)
+        for start in range(0, len(body), chunk_size):
+            self.write(body[start:start + chunk_size])
+            yield self.flush()
+            yield tornado.gen.sleep(0.1)
+        self.finish()
+
+
+class IndexHandler(UpstreamMixin, tornado.web.RequestHandler):
+    @tornado.gen.coroutine
+    def get(self, package_name):
+        if package_name not in self.repository:
+            raise tornado.web.HTTPError(404)
+
+        self.set_header('Content-Type', 'text/html; charset=utf-8')
+        files_url = '{}://{}/files/'.format(self.request.protocol, self.request.host)
+        yield self.send(self.repository.page(package_name, files_url).encode())
+
+
+class FileHandler(UpstreamMixin, tornado.web.RequestHandler):
+    @tornado.gen.coroutine
+    def get(self, name):
+        if not self.repository.has_file(name):
+            raise tornado.web.HTTPError(404)
+
+        self.set_header('Content-Type', 'application/octet-stream')
+        yield self.send(self.repository.content(name))
+
+
+def make_app(repository, latency=0, bandwidth=0):
+    """Upstream application, ``latency`` in second(s) and ``bandwidth`` in byte(s) per second."""
+    settings = {'repository': repository, 'latency': latency, 'bandwidth': bandwidth}
+    return tornado.web.Application([
+        (r"/simple/([^/]+)/?", IndexHandler, settings),
+        (r"/files/([^/]+)", FileHandler, settings),
+    ])
+
+
+def add_arguments(parser):
+    parser.add_argument('--packages', type=int, default=100, help='projects in the repository')
+    parser.add_argument('--files', type=int, default=20, help='files of each project, size of the index page')
+    parser.add_argument('--size', type=int, default=256, help='KiB of each file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=20, help='ms before each upstream response')
+    parser.add_argument('--bandwidth', type=int, default=0, help='KiB/s of each upstream response, 0 for unlimited')
+
+
+def get_repository(args):
+    return Repository(args.packages, args.files, args.size * 1024, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', 1)[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--address', default='127.0.0.1')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    app = make_app(get_repository(args), args.latency / 1000, args.bandwidth * 1024)
+    app.listen(args.port, args.address)
+    try:
+        tornado.ioloop.IOLoop.current().start()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
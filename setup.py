@@ -24,9 +24,13 @@ setup(
     url='https://github.com/hurie83/typi-proxy',
     install_requires=[
         'PyYAML>=3.11',
-        'beautifulsoup4>=4.3.2',
         'tornado>=4.0.1',
     ],
+    extras_require={
+        'bs4': ['beautifulsoup4>=4.3.2'],
+        'brotli': ['brotli'],
+        'curl': ['pycurl'],
+    },
     include_package_data=True,
     packages=[
         'typi_proxy',
@@ -0,0 +1,83 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import shutil
+import tempfile
+from pathlib import Path
+
+import tornado.testing
+from tornado.httpserver import HTTPServer
+
+from typi_proxy.main import Application, load_config
+from typi_proxy.util import FileDigest
+
+
+class RunTestMixin():
+    def runTest(self):
+        # test runner may create the case for runTest, tornado wrap the method it is created for
+        pass
+
+
+class AsyncTestCase(RunTestMixin, tornado.testing.AsyncTestCase):
+    pass
+
+
+class ApplicationTestCase(RunTestMixin, tornado.testing.AsyncHTTPTestCase):
+    """Run the proxy with its default configuration in a temporary directory.
+
+    ``CONFIG`` is written to the configuration file, package file(s) are stored with
+    ``add_package_file``. Application given by ``get_upstream`` is served as the upstream index
+    at ``upstream_url``.
+    """
+    CONFIG = 'index:\n  compress: []\n'
+
+    def setUp(self):
+        self.base = Path(tempfile.mkdtemp())
+        (self.base / 'pypi-cache').mkdir()
+        (self.base / 'pypi-upload').mkdir()
+        (self.base / 'typi-proxy.yml').write_text('path:\n  cache: {}\n  upload: {}\n'.format(
+            self.base / 'pypi-cache', self.base / 'pypi-upload') + self.CONFIG)
+        self.application = None
+        self.upstream_server = None
+        self.upstream_url = None
+        tornado.testing.AsyncHTTPTestCase.setUp(self)
+
+    def tearDown(self):
+        if self.upstream_server is not None:
+            self.upstream_server.stop()
+        tornado.testing.AsyncHTTPTestCase.tearDown(self)
+        if self.application is not None:
+            self.application.upstream.close()
+            self.application.metadata.close()
+            self.application.writers.shutdown()
+        shutil.rmtree(str(self.base))
+
+    def get_upstream(self):
+        return None
+
+    def get_app(self):
+        cfg = load_config(str(self.base / 'typi-proxy.yml'))
+
+        upstream = self.get_upstream()
+        if upstream is not None:
+            sock, port = tornado.testing.bind_unused_port()
+            self.upstream_server = HTTPServer(upstream)
+            self.upstream_server.add_sockets([sock])
+            self.upstream_url = 'http://127.0.0.1:{}'.format(port)
+            cfg['index']['base'] = self.upstream_url + '/simple/'
+
+        self.application = Application(cfg)
+        return self.application
+
+    def add_package_file(self, tier, package, name, data):
+        file = self.application.get_tier_path(tier, package) / name
+        if not file.parent.is_dir():
+            file.parent.mkdir()
+        file.write_bytes(data)
+
+        digest = FileDigest()
+        digest.update(data)
+        self.application.add_file(package, file, tier, digest)
+        return file
@@ -0,0 +1,85 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import unittest
+from time import time
+
+import tornado.gen
+import tornado.web
+
+import support
+
+
+class IndexHandler(tornado.web.RequestHandler):
+    def get(self, package):
+        self.application.hits.append(package)
+        self.write('<a href="/files/{0}-1.0.tar.gz#md5=abc">{0}-1.0.tar.gz</a>'
+                   '<a href="/slow/{0}/">older</a>'.format(package))
+
+
+class SlowHandler(tornado.web.RequestHandler):
+    @tornado.gen.coroutine
+    def get(self, package):
+        yield tornado.gen.sleep(self.application.delay)
+        self.write('<a href="/files/{0}-0.9.tar.gz">{0}-0.9.tar.gz</a>'.format(package))
+
+
+class CrawlerTest(support.ApplicationTestCase):
+    CONFIG = 'index:\n  compress: []\n  deadline: 0.2\n'
+
+    def get_upstream(self):
+        upstream = tornado.web.Application([
+            (r'/simple/([^/]+)/', IndexHandler),
+            (r'/slow/([^/]+)/', SlowHandler),
+        ])
+        upstream.hits = []
+        upstream.delay = 0
+        self.upstream = upstream
+        return upstream
+
+    def wait_crawl(self, package):
+        while package in self.application.crawls:
+            self.io_loop.run_sync(lambda: tornado.gen.sleep(0.05))
+
+    def test_complete(self):
+        response = self.fetch('/simple/foo/')
+        self.assertIn(b'foo-1.0.tar.gz', response.body)
+        self.assertIn(b'foo-0.9.tar.gz', response.body)
+
+        listing = self.application.metadata.load_listing('foo')
+        self.assertEqual(listing.status, 200)
+        self.assertEqual(listing.updated, listing.fetched)
+
+        # fresh index is given without asking upstream
+        self.fetch('/simple/foo/')
+        self.assertEqual(self.upstream.hits, ['foo'])
+
+    def test_deadline(self):
+        self.upstream.delay = 1
+
+        response = self.fetch('/simple/foo/')
+        self.assertIn(b'foo-1.0.tar.gz', response.body)
+        self.assertNotIn(b'foo-0.9.tar.gz', response.body)
+
+        # versions found before the deadline are saved stale
+        listing = self.application.metadata.load_listing('foo')
+        self.assertEqual(listing.status, 200)
+        self.assertEqual([data.name for data in listing.versions], ['foo-1.0.tar.gz'])
+        self.assertLessEqual(listing.updated, time() - self.application.settings['index']['lifetime'] * 60 * 60)
+        self.assertIsNone(self.application.pages.get('foo', 'html'))
+
+        # next request is given the stale index while the index is crawled again
+        self.upstream.delay = 0
+        response = self.fetch('/simple/foo/')
+        self.assertIn(b'foo-1.0.tar.gz', response.body)
+        self.wait_crawl('foo')
+        self.assertEqual(self.upstream.hits, ['foo', 'foo'])
+
+        response = self.fetch('/simple/foo/')
+        self.assertIn(b'foo-0.9.tar.gz', response.body)
+
+
+if __name__ == '__main__':
+    unittest.main()
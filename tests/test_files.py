@@ -0,0 +1,61 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import unittest
+
+from typi_proxy.files import parse_range, match_if_range
+
+ETAG = '"d41d8cd98f00b204e9800998ecf8427e"'
+
+# Sun, 06 Nov 1994 08:49:37 GMT
+MODIFIED = 784111777
+
+
+class ParseRangeTest(unittest.TestCase):
+    def test_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 100))
+        self.assertEqual(parse_range('bytes=100-', 1000), (100, 1000))
+        self.assertEqual(parse_range('bytes = 10-10', 1000), (10, 11))
+
+    def test_end_past_size(self):
+        self.assertEqual(parse_range('bytes=900-5000', 1000), (900, 1000))
+
+    def test_suffix(self):
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 1000))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 1000))
+
+    def test_not_satisfiable(self):
+        start, end = parse_range('bytes=1000-', 1000)
+        self.assertGreaterEqual(start, end)
+
+        start, end = parse_range('bytes=-0', 1000)
+        self.assertGreaterEqual(start, end)
+
+    def test_malformed(self):
+        for header in ['items=0-1', 'bytes=a-b', 'bytes=5-1', 'bytes=0-1,5-6', 'bytes=', 'bytes=-']:
+            self.assertIsNone(parse_range(header, 1000), header)
+
+
+class MatchIfRangeTest(unittest.TestCase):
+    def test_missing(self):
+        self.assertTrue(match_if_range(None, ETAG, MODIFIED))
+
+    def test_etag(self):
+        self.assertTrue(match_if_range(ETAG, ETAG, MODIFIED))
+        self.assertTrue(match_if_range(' {} '.format(ETAG), ETAG, MODIFIED))
+        self.assertFalse(match_if_range('"other"', ETAG, MODIFIED))
+
+    def test_weak_etag(self):
+        # weak validator never match for a range
+        self.assertFalse(match_if_range('W/' + ETAG, ETAG, MODIFIED))
+
+    def test_date(self):
+        self.assertTrue(match_if_range('Sun, 06 Nov 1994 08:49:37 GMT', ETAG, MODIFIED))
+        self.assertFalse(match_if_range('Sun, 06 Nov 1994 08:49:38 GMT', ETAG, MODIFIED))
+        self.assertFalse(match_if_range('not a date', ETAG, MODIFIED))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import unittest
+
+import support
+from typi_proxy.handler import FileMixin, SimpleApiMixin
+from typi_proxy.main import Application, load_config
+from typi_proxy.metadata import UPLOAD
+
+JSON = 'application/vnd.pypi.simple.v1+json'
+HTML = 'text/html'
+
+
+class NegotiateTest(unittest.TestCase):
+    def negotiate(self, accept):
+        return SimpleApiMixin().negotiate(accept)
+
+    def test_single(self):
+        self.assertEqual(self.negotiate('text/html'), HTML)
+        self.assertEqual(self.negotiate(JSON), JSON)
+        self.assertEqual(self.negotiate('application/vnd.pypi.simple.latest+json'),
+                         'application/vnd.pypi.simple.latest+json')
+
+    def test_quality(self):
+        self.assertEqual(self.negotiate('{}; q=0.5, text/html'.format(JSON)), HTML)
+        self.assertEqual(self.negotiate('text/html; q=0.01, {}'.format(JSON)), JSON)
+
+    def test_same_quality_prefer_json(self):
+        # same quality, the order of CONTENT_TYPES break the tie
+        self.assertEqual(self.negotiate('text/html, {}'.format(JSON)), JSON)
+        self.assertEqual(self.negotiate('application/vnd.pypi.simple.v1+html, {}'.format(JSON)), JSON)
+
+    def test_wildcard(self):
+        self.assertEqual(self.negotiate('*/*'), HTML)
+        self.assertEqual(self.negotiate('text/*'), HTML)
+        self.assertEqual(self.negotiate('application/*'), JSON)
+
+    def test_not_acceptable(self):
+        self.assertIsNone(self.negotiate('application/xml'))
+        self.assertIsNone(self.negotiate('text/html; q=0'))
+        self.assertIsNone(self.negotiate('text/html; q=bogus'))
+
+    def test_case_and_space(self):
+        self.assertEqual(self.negotiate(' Text/HTML ;q=1.0 '), HTML)
+
+
+class SplitPathTest(unittest.TestCase):
+    def split_path(self, path):
+        return FileMixin().split_path(path)
+
+    def test_package_file(self):
+        self.assertEqual(self.split_path('foo/foo-1.0.tar.gz'), ('foo', 'foo-1.0.tar.gz'))
+        self.assertEqual(self.split_path('foo//foo-1.0.tar.gz'), ('foo', 'foo-1.0.tar.gz'))
+
+    def test_outside_package(self):
+        for path in ['/etc', '/etc/passwd', '//rv_evil', 'foo/..', '../foo', 'foo/../../x', 'foo', 'foo/bar/baz', '',
+                     'foo/.cache', '.foo/bar', 'foo/foo-1.0.tar.gz.part']:
+            self.assertIsNone(self.split_path(path), path)
+
+
+class SimpleHandlerTest(support.ApplicationTestCase):
+    PIP_ACCEPT = '{}, application/vnd.pypi.simple.v1+html; q=0.1, text/html; q=0.01'.format(JSON)
+
+    def setUp(self):
+        support.ApplicationTestCase.setUp(self)
+        self.add_package_file(UPLOAD, 'foo', 'foo-1.0.tar.gz', b'foo')
+
+    def fetch_index(self, accept):
+        response = self.fetch('/simple/', headers={'Accept': accept})
+        self.assertEqual(response.code, 200)
+        return response
+
+    def test_content_type_of_cached_page(self):
+        # page is cached by the first request, each one is answered with the type it negotiated
+        response = self.fetch_index('application/vnd.pypi.simple.latest+json')
+        self.assertEqual(response.headers['Content-Type'], JSON)
+        self.assertIn(b'"foo"', response.body)
+
+        response = self.fetch_index(self.PIP_ACCEPT)
+        self.assertEqual(response.headers['Content-Type'], JSON)
+
+        response = self.fetch_index('application/vnd.pypi.simple.v1+html')
+        self.assertEqual(response.headers['Content-Type'], 'application/vnd.pypi.simple.v1+html')
+
+        response = self.fetch_index('text/html')
+        self.assertEqual(response.headers['Content-Type'], 'text/html; charset=UTF-8')
+        self.assertIn(b'>foo<', response.body)
+
+    def test_package_without_file(self):
+        # left by a dropped transload
+        self.application.get_cache_path('bar').mkdir()
+
+        # same package(s) are listed once restarted
+        application = Application(load_config(str(self.base / 'typi-proxy.yml')))
+        try:
+            self.assertEqual(list(application.packages), ['foo'])
+        finally:
+            application.metadata.close()
+            application.writers.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
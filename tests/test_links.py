@@ -0,0 +1,37 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import unittest
+
+from typi_proxy.links import extract_html, extract_regex
+
+PAGE = '''\
+<html><body>
+<!-- <a href="/commented/">old</a> -->
+<a href="../../packages/foo-1.0.tar.gz#sha256=abc" data-requires-python="&gt;=3.4">foo-1.0.tar.gz</a><br/>
+<a data-x="a>b" href='foo-1.1.tar.gz'>foo-1.1.tar.gz</a>
+<A HREF=foo-1.2.zip rel=internal>foo-1.2.zip</A>
+<abbr title="x">not an anchor</abbr>
+<!--
+<a href="/multi/line/comment/">old</a>
+-->
+</body></html>
+'''
+
+
+class ExtractTest(unittest.TestCase):
+    def test_regex(self):
+        self.assertEqual(extract_regex(PAGE), [
+            {'href': '../../packages/foo-1.0.tar.gz#sha256=abc', 'data-requires-python': '>=3.4'},
+            {'data-x': 'a>b', 'href': 'foo-1.1.tar.gz'},
+            {'href': 'foo-1.2.zip', 'rel': 'internal'},
+        ])
+
+    def test_regex_match_html(self):
+        self.assertEqual(extract_regex(PAGE), extract_html(PAGE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import unittest
+
+from typi_proxy.pages import select_encoding
+
+ENCODINGS = ['br', 'gzip']
+
+
+class SelectEncodingTest(unittest.TestCase):
+    def test_identity(self):
+        self.assertIsNone(select_encoding('', ENCODINGS))
+        self.assertIsNone(select_encoding('deflate', ENCODINGS))
+        self.assertIsNone(select_encoding('gzip', []))
+
+    def test_preference_order(self):
+        self.assertEqual(select_encoding('gzip, deflate, br', ENCODINGS), 'br')
+        self.assertEqual(select_encoding('gzip, deflate', ENCODINGS), 'gzip')
+        self.assertEqual(select_encoding('br, gzip', ['gzip']), 'gzip')
+
+    def test_quality(self):
+        self.assertEqual(select_encoding('br;q=0.5, gzip', ENCODINGS), 'gzip')
+        self.assertEqual(select_encoding('br;q=0, gzip;q=0.1', ENCODINGS), 'gzip')
+        self.assertIsNone(select_encoding('br;q=0, gzip;q=0', ENCODINGS))
+        self.assertIsNone(select_encoding('gzip;q=bogus', ENCODINGS))
+
+    def test_wildcard(self):
+        self.assertEqual(select_encoding('*', ENCODINGS), 'br')
+        self.assertEqual(select_encoding('br;q=0, *', ENCODINGS), 'gzip')
+
+    def test_identity_preferred(self):
+        self.assertIsNone(select_encoding('gzip;q=0.5, identity', ENCODINGS))
+        self.assertEqual(select_encoding('gzip, identity;q=0.5', ENCODINGS), 'gzip')
+
+    def test_case_and_space(self):
+        self.assertEqual(select_encoding(' GZip ; q=1 ', ENCODINGS), 'gzip')
+
+
+if __name__ == '__main__':
+    unittest.main()
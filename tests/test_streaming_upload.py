@@ -0,0 +1,147 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import random
+import unittest
+
+from tornado.web import HTTPError
+
+from typi_proxy.streaming_upload import StreamingFormDataHandler
+
+BOUNDARY = b'XxXxBOUNDARY'
+
+
+class Request():
+    def __init__(self, content_type):
+        self.headers = {'content-type': content_type}
+
+
+class FormHandler(StreamingFormDataHandler):
+    """Collect every disposition, ``content`` is streamed while the other are buffered."""
+
+    def __init__(self, content_type):
+        # handler is driven without an application nor a connection
+        self.request = Request(content_type)
+        self.values = {}
+        self.calls = []
+        self.prepare()
+
+    def on_content_begin(self, data):
+        self.calls.append('begin')
+        self.content = bytearray(data)
+
+    def on_content_data(self, data):
+        self.content += data
+
+    def on_content_end(self):
+        self.calls.append('end')
+        self.values['content'] = bytes(self.content)
+
+    def on_name_end(self):
+        self.values['name'] = bytes(self._disp_buffer)
+
+    def on_md5_digest_end(self):
+        self.values['md5_digest'] = bytes(self._disp_buffer)
+
+    def on_empty_end(self):
+        self.values['empty'] = bytes(self._disp_buffer)
+
+
+def build_body(fields, newline=b'\r\n', preamble=b'', distutils=False):
+    """Multipart body of ``(name, value, filename)`` fields, ``distutils`` lay it out as old distutils do."""
+    body = preamble
+    for name, value, filename in fields:
+        disposition = b'Content-Disposition: form-data; name="' + name + b'"'
+        if filename:
+            disposition += b'; filename="' + filename + b'"'
+
+        if distutils:
+            body += b'\n--' + BOUNDARY + b'\n' + disposition + b'\n\n' + value
+        else:
+            body += b'--' + BOUNDARY + newline + disposition + newline + newline + value + newline
+
+    if distutils:
+        return body + b'\n--' + BOUNDARY + b'--\r\n'
+    return body + b'--' + BOUNDARY + b'--' + newline
+
+
+def parse(body, sizes, content_type=None):
+    handler = FormHandler(content_type or 'multipart/form-data; boundary=' + BOUNDARY.decode())
+
+    pos = 0
+    for size in sizes:
+        if pos >= len(body):
+            break
+        handler.data_received(body[pos:pos + size])
+        pos += size
+
+    if pos < len(body):
+        handler.data_received(body[pos:])
+    return handler
+
+
+class StreamingFormDataTest(unittest.TestCase):
+    FIELDS = [(b'name', b'My-Pkg', None), (b'content', b'data\r\n--XxXx\r', b'x.tar.gz'), (b'empty', b'', None),
+              (b'md5_digest', b'abc', None)]
+
+    def expected(self, fields):
+        return {name.decode(): value for name, value, _ in fields}
+
+    def test_whole_body(self):
+        for newline in [b'\r\n', b'\n']:
+            handler = parse(build_body(self.FIELDS, newline), [])
+            self.assertEqual(handler.values, self.expected(self.FIELDS))
+            self.assertEqual(handler.calls, ['begin', 'end'])
+
+    def test_byte_by_byte(self):
+        for newline in [b'\r\n', b'\n']:
+            body = build_body(self.FIELDS, newline)
+            handler = parse(body, [1] * len(body))
+            self.assertEqual(handler.values, self.expected(self.FIELDS))
+
+    def test_quoted_boundary_and_preamble(self):
+        body = build_body(self.FIELDS, preamble=b'preamble\r\n')
+        handler = parse(body, [7] * len(body), 'multipart/form-data; boundary="{}"'.format(BOUNDARY.decode()))
+        self.assertEqual(handler.values, self.expected(self.FIELDS))
+
+    def test_bare_lf_keep_trailing_cr(self):
+        fields = [(b'content', b'data\r', b'x.tar.gz')]
+        for distutils in [False, True]:
+            body = build_body(fields, b'\n', distutils=distutils)
+            for size in [1, 2, 3, len(body)]:
+                handler = parse(body, [size] * len(body))
+                self.assertEqual(handler.values, self.expected(fields), (distutils, size))
+
+    def test_header_too_long(self):
+        body = b'--' + BOUNDARY + b'\r\nX-Pad: ' + b'x' * StreamingFormDataHandler.MAX_HEADER_SIZE
+        with self.assertRaises(HTTPError):
+            parse(body, [1000] * len(body))
+
+    def test_chunk_boundaries(self):
+        """Random content full of near boundary, cut in random chunk, is given back as it was sent."""
+        rnd = random.Random(1)
+        junk = [b'\r', b'\n', b'\r\n', b'\r\n--', b'\n--XxXx', b'\r\n--XxXxBOUNDARz', b'x--XxXxBOUNDARY', b'\r\r\n-']
+
+        for trial in range(3000):
+            content = b''.join(bytes(rnd.getrandbits(8) for _ in range(rnd.randint(0, 50))) + rnd.choice(junk)
+                               for _ in range(rnd.randint(0, 40)))
+            content += rnd.choice([b'', b'\r', b'\n', b'\r\n-'])
+
+            fields = [(b'name', b'My-Pkg', None), (b'content', content, b'x.tar.gz'), (b'empty', b'', None),
+                      (b'md5_digest', b'abc', None)]
+            rnd.shuffle(fields)
+
+            mode = trial % 3
+            body = build_body(fields, b'\r\n' if mode == 0 else b'\n', b'preamble\r\n' if trial % 5 == 0 else b'',
+                              mode == 2)
+            sizes = [rnd.choice([1, 2, 3, 7, 13, 64, 1000]) for _ in range(len(body))]
+
+            handler = parse(body, sizes)
+            self.assertEqual(handler.values, self.expected(fields), trial)
+            self.assertEqual(handler.calls, ['begin', 'end'], trial)
+
+
+if __name__ == '__main__':
+    unittest.main()
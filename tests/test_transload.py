@@ -0,0 +1,165 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import hashlib
+import unittest
+from urllib.parse import quote
+
+import tornado.gen
+import tornado.web
+
+import support
+from typi_proxy.metadata import CACHE
+
+NAME = 'foo-1.0.tar.gz'
+DATA = bytes(range(256)) * 1024
+
+
+class FileHandler(tornado.web.RequestHandler):
+    """Package file, served by the behavior set on the application for the next request."""
+
+    @tornado.gen.coroutine
+    def get(self, name):
+        upstream = self.application
+        request_range = self.request.headers.get('Range')
+        upstream.hits.append(request_range)
+
+        status = upstream.status.pop(0) if upstream.status else None
+        if status is not None:
+            raise tornado.web.HTTPError(status)
+
+        start = 0
+        if request_range and upstream.ranges:
+            start = int(request_range.split('=')[1].split('-')[0])
+            content_start = upstream.content_start.pop(0) if upstream.content_start else start
+            self.set_status(206)
+            self.set_header('Content-Range', 'bytes {}-{}/{}'.format(content_start, len(DATA) - 1, len(DATA)))
+        self.set_header('Content-Length', len(DATA) - start)
+
+        cut = upstream.cut.pop(0) if upstream.cut else None
+        position = start
+        while position < len(DATA):
+            if cut is not None and position >= cut:
+                # connection lost midway
+                self.request.connection.stream.close()
+                return
+
+            self.write(DATA[position:position + 64 * 1024])
+            position += 64 * 1024
+            yield self.flush()
+
+
+class TransloadTest(support.ApplicationTestCase):
+    CONFIG = 'index:\n  compress: []\nwriter:\n  pending: 65536\n'
+
+    def get_upstream(self):
+        upstream = tornado.web.Application([(r'/files/(.+)', FileHandler)])
+        upstream.hits = []
+        upstream.ranges = True
+        upstream.status = []
+        upstream.content_start = []
+        upstream.cut = []
+        self.upstream = upstream
+        return upstream
+
+    def setUp(self):
+        support.ApplicationTestCase.setUp(self)
+        self.file = self.application.get_cache_path('foo') / NAME
+        self.part = self.file.with_name(NAME + '.part')
+        self.file.parent.mkdir()
+
+    def fetch_file(self, md5=None):
+        link = '{}/files/{}#md5={}'.format(self.upstream_url, NAME, md5 or hashlib.md5(DATA).hexdigest())
+        response = self.fetch('/package/remote/foo/{}?link={}'.format(NAME, quote(link)))
+
+        # whole body may be received before the transload is verified
+        while self.application.transloads:
+            self.io_loop.run_sync(lambda: tornado.gen.sleep(0.01))
+        return response
+
+    def assertStored(self, response):
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, DATA)
+        self.assertEqual(self.file.read_bytes(), DATA)
+        self.assertFalse(self.part.exists())
+
+        data = self.application.metadata.get_file('foo', NAME, CACHE)
+        self.assertEqual(data.md5, hashlib.md5(DATA).hexdigest())
+        self.assertEqual(data.sha256, hashlib.sha256(DATA).hexdigest())
+        self.assertEqual(data.size, len(DATA))
+
+    def assertNotStored(self):
+        self.assertFalse(self.file.exists())
+        self.assertIsNone(self.application.metadata.get_file('foo', NAME, CACHE))
+        self.assertEqual(self.application.metrics.active_streams.values.get(('transload',), 0), 0)
+
+    def test_transload(self):
+        self.assertStored(self.fetch_file())
+        self.assertEqual(self.upstream.hits, [None])
+
+    def test_resume_part(self):
+        self.part.write_bytes(DATA[:100000])
+
+        self.assertStored(self.fetch_file())
+        self.assertEqual(self.upstream.hits, ['bytes=100000-'])
+
+    def test_range_not_supported(self):
+        # part is written again from the whole file sent by upstream
+        self.part.write_bytes(DATA[:100000])
+        self.upstream.ranges = False
+
+        self.assertStored(self.fetch_file())
+        self.assertEqual(self.upstream.hits, ['bytes=100000-'])
+
+    def test_range_not_satisfiable(self):
+        # part doesn't match with upstream, start over
+        self.part.write_bytes(DATA[:100000])
+        self.upstream.status = [416]
+
+        self.assertStored(self.fetch_file())
+        self.assertEqual(self.upstream.hits, ['bytes=100000-', None])
+
+    def test_unexpected_content_range(self):
+        self.part.write_bytes(DATA[:100000])
+        self.upstream.content_start = [0]
+
+        response = self.fetch_file()
+        self.assertEqual(response.code, 502)
+        self.assertNotStored()
+        self.assertFalse(self.part.exists())
+
+        # nothing is left to resume from
+        self.assertStored(self.fetch_file())
+        self.assertEqual(self.upstream.hits, ['bytes=100000-', None])
+
+    def test_retry(self):
+        self.upstream.cut = [65536 * 2, 65536 * 3]
+
+        self.assertStored(self.fetch_file())
+        self.assertEqual(self.upstream.hits, [None, 'bytes=131072-', 'bytes=196608-'])
+
+    def test_retry_exhausted(self):
+        retry = self.application.settings['transload']['retry']
+        self.upstream.ranges = False
+        self.upstream.cut = [65536] * (retry + 1)
+
+        self.fetch_file()
+        self.assertNotStored()
+        self.assertEqual(len(self.upstream.hits), retry + 1)
+
+        # part is kept for the next request to resume from
+        self.assertEqual(self.part.stat().st_size, 65536)
+
+    def test_digest_mismatch(self):
+        self.fetch_file('0' * 32)
+        self.assertNotStored()
+        self.assertFalse(self.part.exists())
+
+        self.assertStored(self.fetch_file())
+        self.assertEqual(self.upstream.hits, [None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
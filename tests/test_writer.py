@@ -0,0 +1,118 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from tornado.testing import gen_test
+
+import support
+from typi_proxy.util import FileDigest
+from typi_proxy.writer import StreamWriter
+
+
+class FakeFile():
+    """File kept in memory, write fail once ``fail`` is set."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.fail = False
+        self.closed = False
+
+    def write(self, chunk):
+        if self.fail:
+            raise OSError('disk full')
+        self.data.extend(chunk)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class StreamWriterTest(support.AsyncTestCase):
+    def setUp(self):
+        support.AsyncTestCase.setUp(self)
+        self.executor = ThreadPoolExecutor(2)
+        self.file = FakeFile()
+        self.digest = FileDigest()
+        self.written = []
+        self.writer = StreamWriter(self.executor, {'pending': 10, 'fsync': 'none'}, self.file, [self.digest],
+                                   self.written.append)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        support.AsyncTestCase.tearDown(self)
+
+    @gen_test
+    def test_backpressure(self):
+        self.assertIsNone(self.writer.write(b'a' * 5))
+        self.assertIsNone(self.writer.write(b'b' * 5))
+
+        # more than pending in flight, caller wait before reading more
+        future = self.writer.write(b'c' * 5)
+        self.assertIsNotNone(future)
+        self.assertIsNotNone(self.writer.wait())
+
+        yield future
+        self.assertLessEqual(self.writer.pending, 10)
+
+        yield self.writer.drain()
+        self.assertEqual(self.writer.pending, 0)
+        self.assertEqual(bytes(self.file.data), b'a' * 5 + b'b' * 5 + b'c' * 5)
+        self.assertEqual(sum(self.written), 15)
+        self.assertEqual(self.digest.size, 15)
+
+    @gen_test
+    def test_order(self):
+        self.writer.write(b'ab')
+        first = self.writer.call(lambda: bytes(self.file.data))
+        self.writer.write(b'cd')
+        second = self.writer.call(lambda: bytes(self.file.data))
+        self.writer.write(b'ef')
+
+        # call run after every write given before, and before the following one
+        self.assertEqual((yield first), b'ab')
+        self.assertEqual((yield second), b'abcd')
+
+        yield self.writer.commit()
+        self.assertEqual(bytes(self.file.data), b'abcdef')
+
+    @gen_test
+    def test_error(self):
+        self.writer.write(b'ok')
+        yield self.writer.drain()
+
+        self.file.fail = True
+        future = self.writer.write(b'x' * 20)
+
+        # waiter is released by the error, the caller find it on the next write
+        yield future
+        self.assertIsInstance(self.writer.error, OSError)
+        self.assertIsNone(self.writer.wait())
+
+        self.file.fail = False
+        self.assertIsNone(self.writer.write(b'dropped'))
+
+        called = []
+        with self.assertRaises(OSError):
+            yield self.writer.call(called.append, True)
+        with self.assertRaises(OSError):
+            yield self.writer.commit()
+        self.assertEqual(called, [])
+
+        # close always run
+        yield self.writer.close()
+        self.assertTrue(self.file.closed)
+
+        yield self.writer.drain()
+        self.assertEqual(bytes(self.file.data), b'ok')
+        self.assertEqual(self.written, [2])
+        self.assertEqual(self.writer.pending, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
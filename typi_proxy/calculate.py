@@ -0,0 +1,187 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import logging
+import os
+import signal
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from time import time
+
+from .metadata import CACHE, UPLOAD
+from .util import Checksum
+
+_log = logging.getLogger(__name__)
+
+Pending = namedtuple('Pending', ['package', 'tier', 'file', 'size', 'mtime', 'known'])
+
+
+def digest_file(file):
+    """Return ``(md5, sha256, size)`` of ``file``, run in the pool."""
+    # Ctrl-C is left to the main process, a worker interrupted midway can hang the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    digest = Checksum(file.parent).digest(file)
+    return digest.md5, digest.sha256, digest.size
+
+
+class Calculator():
+    """Record digest of every stored package file, ``jobs`` file(s) hashed at a time.
+
+    File whose size and mtime match what is recorded are skipped, so a run stopped midway goes on
+    from where it was, results are saved every ``BATCH_SIZE`` file(s). Record of file no longer
+    on disk is removed, and ``checksums.md5`` of each tier is written from the records once done.
+    """
+    CHECKSUMS = 'checksums.md5'
+    BATCH_SIZE = 100
+
+    # second(s) between progress log
+    PROGRESS_INTERVAL = 10
+
+    def __init__(self, metadata, cfg, jobs=None, force=False):
+        self.metadata = metadata
+        self.cfg = cfg
+        self.jobs = jobs or os.cpu_count() or 1
+        self.force = force
+
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.hashed = 0
+        self.hashed_bytes = 0
+        self.changed = 0
+        self.removed = []
+
+        self._added = []
+        self._updated = []
+        self._started = None
+        self._logged = None
+
+    def scan(self):
+        """Return list of ``Pending`` file(s) to hash."""
+        pending = []
+        for tier, base in self.tiers():
+            # recorded before the scan, file added meanwhile is found on disk anyway
+            missing = {(data.package, data.name): data for data in self.metadata.tier_files(tier)}
+
+            for path in sorted(base.iterdir()):
+                if not path.is_dir():
+                    continue
+
+                known = {data.name: data for data in self.metadata.files(path.name, tier)}
+                for file in Checksum(path).iter_files():
+                    missing.pop((path.name, file.name), None)
+
+                    stat = file.stat()
+                    data = known.get(file.name)
+                    if (not self.force and data is not None and data.sha256 and data.size == stat.st_size and
+                            data.mtime == stat.st_mtime):
+                        self.skipped += 1
+                        continue
+
+                    pending.append(Pending(path.name, tier, file, stat.st_size, stat.st_mtime, data is not None))
+                    self.files += 1
+                    self.bytes += stat.st_size
+
+            self.removed.extend((package, name, tier) for package, name in sorted(missing))
+
+        return pending
+
+    def tiers(self):
+        return [(CACHE, Path(self.cfg['path']['cache'])),
+                (UPLOAD, Path(self.cfg['path']['upload']))]
+
+    def run(self):
+        pending = self.scan()
+        if self.removed:
+            self.metadata.remove_files(self.removed)
+            _log.info('%d file(s) no longer on disk removed', len(self.removed))
+
+        _log.info('%d file(s) of %.1f MiB to hash with %d job(s), %d file(s) up to date', self.files,
+                  self.bytes / 1024 / 1024, self.jobs, self.skipped)
+
+        self._started = self._logged = time()
+        running = {}
+        try:
+            with ProcessPoolExecutor(self.jobs) as executor:
+                for entry in pending:
+                    running[executor.submit(digest_file, entry.file)] = entry
+
+                    # only a few file(s) queued ahead of the pool
+                    while len(running) >= self.jobs * 2:
+                        self.collect(running, wait(running, return_when=FIRST_COMPLETED).done)
+
+                while running:
+                    self.collect(running, wait(running, return_when=FIRST_COMPLETED).done)
+        except KeyboardInterrupt:
+            for future in running:
+                future.cancel()
+            _log.warning('interrupted, run calculate again to go on')
+        finally:
+            self.save()
+
+        self.progress()
+        self.write_checksums()
+        return self.hashed
+
+    def collect(self, running, done):
+        for future in done:
+            entry = running.pop(future)
+            try:
+                md5, sha256, size = future.result()
+                stat = entry.file.stat()
+            except OSError as e:
+                _log.warning('unable to hash %s: %s', entry.file, e)
+                continue
+
+            if (stat.st_size, stat.st_mtime) != (entry.size, entry.mtime) or size != entry.size:
+                # written while being hashed, left for the next run
+                _log.warning('%s changed while hashed', entry.file)
+                self.changed += 1
+                continue
+
+            row = (entry.package, entry.file.name, entry.tier, md5, size, entry.mtime)
+            if entry.known:
+                self._updated.append(row + (sha256,))
+            else:
+                self._added.append(row + (None, sha256))
+
+            self.hashed += 1
+            self.hashed_bytes += size
+
+        if len(self._added) + len(self._updated) >= self.BATCH_SIZE:
+            self.save()
+
+        if time() - self._logged >= self.PROGRESS_INTERVAL:
+            self.progress()
+
+    def save(self):
+        if self._added:
+            self.metadata.add_files(self._added)
+        if self._updated:
+            self.metadata.update_digests(self._updated)
+        self._added, self._updated = [], []
+
+    def write_checksums(self):
+        """Write ``md5 *package/name`` of every recorded file of each tier, as ``md5sum -c`` read them."""
+        for tier, base in self.tiers():
+            lines = [''.join([data.md5, Checksum.SEPARATOR, data.package, '/', data.name])
+                     for data in self.metadata.tier_files(tier)]
+
+            with (base / self.CHECKSUMS).open('w') as f:
+                f.write('\n'.join(lines))
+
+    def progress(self):
+        self._logged = time()
+        elapsed = max(self._logged - self._started, 1e-6)
+        rate = self.hashed_bytes / elapsed
+
+        eta = ''
+        if rate and self.hashed_bytes < self.bytes:
+            eta = ', {:.0f} s left'.format((self.bytes - self.hashed_bytes) / rate)
+
+        _log.info('hashed %d of %d file(s), %.1f of %.1f MiB at %.1f MiB/s%s', self.hashed, self.files,
+                  self.hashed_bytes / 1024 / 1024, self.bytes / 1024 / 1024, rate / 1024 / 1024, eta)
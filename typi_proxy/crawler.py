@@ -0,0 +1,316 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+from collections import OrderedDict, Counter
+from functools import partial
+from os.path import basename
+from time import perf_counter, time
+from urllib.parse import urljoin, urlsplit, parse_qs, urlunsplit
+
+import tornado.ioloop
+from tornado.log import app_log
+
+from .links import get_extractor, decode_body
+from .util import PackageData
+
+
+NOT_FOUND = (404, 410)
+
+
+def negative_ttl(cfg, code):
+    """Second(s) upstream miss or error on the index is remembered, ``None`` if it isn't."""
+    if code in NOT_FOUND:
+        return cfg['negative']['not_found'] * 60
+    if code is not None and code >= 500:
+        return cfg['negative']['error'] * 60
+    return None
+
+
+class Crawler():
+    """Crawl the upstream index of a package and the pages it link to, up to ``index.depth``.
+
+    Pages are fetched concurrently, limited by ``index.parallel`` overall and ``index.per_host``
+    for each host, and the crawl is cut after ``index.deadline`` second(s). Versions found are
+    pushed to the attached listeners as each page is parsed. Only one crawl run for a package at
+    a time, request arriving meanwhile attach to it. Index of a crawl cut short is saved already
+    stale, so it is crawled again by the next request.
+
+    A ``refresh`` crawl replaces a stale index in the background, rendered page of the package is
+    dropped once the new index is saved.
+    """
+    source_extensions = ('.tar.gz', '.tar.bz2', '.tar', '.zip', '.tgz', '.tbz', '.tbz2',)
+    binary_extensions = ('.egg', '.exe', '.msi', '.whl',)
+    others_extensions = ('.pybundle',)
+
+    extensions = source_extensions + binary_extensions + others_extensions
+
+    def __init__(self, application, package_name, refresh=False):
+        self.application = application
+        self.package_name = package_name
+        self.refresh = refresh
+        self.cfg = application.settings['index']
+
+        self.code = None
+        self.done = False
+        self.expired = False
+        self.package_versions = OrderedDict()
+        self.visited_links = set()
+        self.links = []
+        self.listeners = []
+
+        # page cache version ``(before, after)`` the crawl invalidated the package page
+        self.invalidated = None
+
+        # second(s) spent parsing upstream page
+        self.parse_time = 0
+
+        self.client = application.upstream
+        self.extract = get_extractor(self.cfg['parser'])
+        self._active = 0
+        self._hosts = Counter()
+        self._deadline = None
+
+    def start(self):
+        self.application.crawls[self.package_name] = self
+
+        index_url = None
+        if self.application.settings['package']:
+            index_url = self.application.settings['package'].get(self.package_name, {}).get('base')
+
+        if not index_url:
+            index_url = self.cfg['base']
+
+        if not index_url:
+            self.finish()
+            return
+
+        url = urljoin(index_url, self.package_name + '/')
+        if not url.endswith('/'):
+            url += '/'
+
+        ioloop = tornado.ioloop.IOLoop.current()
+        self._deadline = ioloop.add_timeout(ioloop.time() + self.cfg['deadline'], self.expire)
+
+        self.fetch(url, 0, self.parse_index)
+
+    def attach(self, listener):
+        for data in self.package_versions.values():
+            listener.on_crawl_version(self, data)
+
+        if self.done:
+            listener.on_crawl_finish(self)
+        else:
+            self.listeners.append(listener)
+
+    def detach(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def is_archive(self, url):
+        if url is None:
+            return False
+
+        url = urlsplit(url.lower()).path
+        urls = url.rsplit('/')
+        if urls:
+            url = urls[-1]
+
+        return url.endswith(self.extensions) and url.replace('-', '_').startswith(self.package_name)
+
+    def add_version(self, name, md5, url, href, sha256=None):
+        if name in self.package_versions:
+            return
+
+        app_log.debug('add %s', href)
+
+        data = PackageData(name, md5, url, 0, sha256)
+        self.package_versions[data.name] = data
+
+        for listener in list(self.listeners):
+            listener.on_crawl_version(self, data)
+
+    def add_link(self, url, depth):
+        if depth > self.cfg['depth']:
+            return
+
+        split = urlsplit(url)
+        strip_url = urlunsplit((split.scheme, split.netloc, split.path, None, None))
+        if strip_url in self.visited_links:
+            return
+        self.visited_links.add(strip_url)
+
+        app_log.debug('found %s', url)
+        self.links.append((url, depth))
+
+    def fetch(self, url, depth, callback):
+        host = urlsplit(url).netloc
+        self._active += 1
+        self._hosts[host] += 1
+
+        app_log.debug('fetch %s', url)
+        self.client.fetch(url, callback=partial(self.process_response, host, depth, callback))
+
+    def fetch_next(self):
+        if self.done:
+            return
+
+        parallel = self.cfg['parallel']
+        per_host = self.cfg['per_host']
+
+        for url, depth in list(self.links):
+            if self._active >= parallel:
+                break
+
+            if self._hosts[urlsplit(url).netloc] >= per_host:
+                continue
+
+            self.links.remove((url, depth))
+            self.fetch(url, depth, self.parse_remote)
+
+        if not self._active:
+            self.finish()
+
+    def process_response(self, host, depth, callback, response):
+        self._active -= 1
+        self._hosts[host] -= 1
+
+        if self.done:
+            return
+
+        try:
+            callback(response, depth)
+        finally:
+            for listener in list(self.listeners):
+                listener.on_crawl_page(self)
+            self.fetch_next()
+
+    def extract_links(self, response):
+        started = perf_counter()
+        try:
+            return self.extract(decode_body(response))
+        finally:
+            self.parse_time += perf_counter() - started
+
+    def parse_remote(self, response, depth):
+        if response.code != 200:
+            app_log.warning('Error while getting remote %s '
+                            'Errors details: (%s: %s) %s', response.effective_url,
+                            response.code, response.reason, response.body)
+            return
+
+        base_url = response.effective_url
+        base = urlsplit(base_url)
+
+        content_type = response.headers.get('content-type', '')
+        if content_type in ('application/x-gzip',):
+            # in this case the URL was a redirection to download
+            # a package. For example, sourceforge.
+            self.add_version(basename(base.path), '', base_url, base_url)
+            return
+
+        if not response.body:
+            return
+
+        app_log.debug('parse %s', base_url)
+
+        for anchor in self.extract_links(response):
+            href = anchor.get('href')
+            if not href:
+                continue
+
+            current_url = urljoin(base_url, href)
+            current = urlsplit(current_url)
+
+            if self.is_archive(current.path):
+                self.add_version(basename(current.path), '', current_url, href)
+            elif current.netloc == base.netloc and current.path.startswith(base.path):
+                self.add_link(current_url, depth + 1)
+
+    def parse_index(self, response, depth):
+        self.code = response.code
+        if response.code != 200:
+            app_log.warning('Error while getting index %s '
+                            'Errors details: (%s: %s) %s', response.effective_url,
+                            response.code, response.reason, response.body)
+            return
+
+        base_url = response.effective_url
+        app_log.debug('parse %s', base_url)
+
+        for panchor in self.extract_links(response):
+            if 'homepage' in panchor.get('rel', '').split():
+                # skip getting information on the project homepage
+                continue
+
+            href = panchor.get('href')
+            if not href:
+                continue
+
+            href = urljoin(base_url, href)
+            url = urlsplit(href)
+
+            if self.is_archive(url.path):
+                pkg_name = basename(url.path)
+
+                md5 = sha256 = None
+                if url.fragment:
+                    fragment = parse_qs(url.fragment)
+                    if 'md5' in fragment:
+                        md5 = fragment['md5'][0]
+                    if 'sha256' in fragment:
+                        sha256 = fragment['sha256'][0]
+
+                self.add_version(pkg_name, md5, href, href, sha256)
+
+            else:
+                self.add_link(href, depth + 1)
+
+    def expire(self):
+        app_log.warning('deadline reached while crawling %s, %d link(s) left', self.package_name,
+                        len(self.links) + self._active)
+        self._deadline = None
+        self.expired = True
+        self.finish()
+
+    def finish(self):
+        if self.done:
+            return
+        self.done = True
+
+        if self._deadline is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self._deadline)
+            self._deadline = None
+
+        if self.application.crawls.get(self.package_name) is self:
+            del self.application.crawls[self.package_name]
+
+        metadata = self.application.metadata
+        if self.code == 200:
+            fetched = time()
+            updated = None
+            if self.expired:
+                # versions may be missing, given until the refresh crawl started by the next request is done
+                updated = fetched - self.cfg['lifetime'] * 60 * 60
+            metadata.save_listing(self.package_name, self.code, list(self.package_versions.values()), fetched,
+                                  updated)
+            if self.refresh:
+                self.invalidate()
+
+        elif negative_ttl(self.cfg, self.code) is not None:
+            # remember upstream miss or error so the next request doesn't hit upstream again,
+            # missing package is gone from upstream while error keep previous versions
+            metadata.save_listing(self.package_name, self.code, [] if self.code in NOT_FOUND else None)
+            self.invalidate()
+
+        for listener in list(self.listeners):
+            listener.on_crawl_finish(self)
+        self.listeners = []
+
+    def invalidate(self):
+        """Drop the cached page of the package, page rendered by listener(s) of the crawl is still stored."""
+        pages = self.application.pages
+        version = pages.version(self.package_name)
+        pages.invalidate(self.package_name)
+        self.invalidated = (version, pages.version(self.package_name))
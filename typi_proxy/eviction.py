@@ -0,0 +1,115 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+from time import time
+
+import tornado.gen
+import tornado.ioloop
+from tornado.log import app_log
+
+from .metadata import CACHE
+
+
+def is_pinned(cfg, package_name):
+    setting = (cfg['package'] or {}).get(package_name) or {}
+    return bool(setting.get('pin', False))
+
+
+def select_evictions(metadata, cfg):
+    """Return the cache usage in byte(s) and list of cached file to remove to bring it under budget.
+
+    Uploaded file and file of a pinned package are never selected.
+    """
+    budget = cfg['eviction']['size'] * 1024 * 1024
+    usage = metadata.usage(CACHE)
+
+    files = []
+    if not budget or usage <= budget:
+        return usage, files
+
+    left = usage
+    for data in metadata.evictable(cfg['eviction']['policy']):
+        if left <= budget:
+            break
+
+        if is_pinned(cfg, data.package):
+            continue
+
+        files.append(data)
+        left -= data.size or 0
+
+    return usage, files
+
+
+class Evictor():
+    """Keep ``path.cache`` under ``eviction.size`` MiB, checked every ``eviction.interval`` minute(s).
+
+    Access to cached file is counted in memory and written to the metadata store on each run,
+    before the least valuable file according to ``eviction.policy`` are removed.
+    """
+    BATCH_SIZE = 100
+
+    def __init__(self, application):
+        self.application = application
+        self.cfg = application.settings['eviction']
+
+        self.accesses = {}
+        self.running = False
+        self._callback = None
+
+        # fail early on unknown policy
+        application.metadata.evictable(self.cfg['policy'])
+
+    def start(self, evict=True):
+        """Write access count every ``eviction.interval`` minute(s), and evict too when ``evict``.
+
+        Every worker count access to the file it serve, only one of them evict.
+        """
+        self._callback = tornado.ioloop.PeriodicCallback(self.run if evict else self.flush,
+                                                         self.cfg['interval'] * 60 * 1000)
+        self._callback.start()
+
+    def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+
+    def touch(self, package_name, name):
+        _, hits = self.accesses.get((package_name, name), (None, 0))
+        self.accesses[(package_name, name)] = (time(), hits + 1)
+
+    def flush(self):
+        if not self.accesses:
+            return
+
+        accesses, self.accesses = self.accesses, {}
+        self.application.metadata.touch_files([(package_name, name, CACHE, accessed, hits)
+                                               for (package_name, name), (accessed, hits) in accesses.items()])
+
+    @tornado.gen.coroutine
+    def run(self):
+        if self.running:
+            return
+        self.running = True
+
+        try:
+            self.flush()
+
+            usage, files = select_evictions(self.application.metadata, self.application.settings)
+            if not files:
+                return
+
+            app_log.info('evict %d file(s) of %d byte(s) cache', len(files), usage)
+            for i, data in enumerate(files, 1):
+                app_log.debug('evict %s/%s', data.package, data.name)
+                self.application.remove_file(data.package, data.name, CACHE)
+
+                if not i % self.BATCH_SIZE:
+                    # let request in between
+                    yield tornado.gen.moment
+        except Exception:
+            app_log.exception('eviction failed')
+        finally:
+            self.running = False
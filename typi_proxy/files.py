@@ -0,0 +1,152 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import calendar
+import email.utils
+import os
+from collections import OrderedDict
+
+
+class OpenFile():
+    """Descriptor and stat result of a package file, shared by every request serving it."""
+
+    def __init__(self, path, fd):
+        self.path = path
+        self.fd = fd
+
+        stat = os.fstat(fd)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+
+        self.etag = None
+        self.users = 0
+        self.stale = False
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class FileCache():
+    """Open package file by path, the least recently used one is closed past ``size`` file(s).
+
+    File evicted or invalidated while it is being sent is only closed once released by every
+    request using it.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.files = OrderedDict()
+
+    def open(self, path):
+        """Return the ``OpenFile`` of ``path``, raise ``FileNotFoundError`` if there is none."""
+        key = str(path)
+
+        entry = self.files.get(key)
+        if entry is None:
+            entry = OpenFile(key, os.open(key, os.O_RDONLY))
+            self.files[key] = entry
+
+            while len(self.files) > self.size:
+                self.drop(self.files.popitem(last=False)[1])
+        else:
+            self.files.move_to_end(key)
+
+        entry.users += 1
+        return entry
+
+    def release(self, entry):
+        entry.users -= 1
+        if entry.stale and not entry.users:
+            entry.close()
+
+    def invalidate(self, path):
+        """Forget ``path``, to be called whenever the file is replaced or removed."""
+        entry = self.files.pop(str(path), None)
+        if entry is not None:
+            self.drop(entry)
+
+    def drop(self, entry):
+        entry.stale = True
+        if not entry.users:
+            entry.close()
+
+    def close(self):
+        for entry in self.files.values():
+            self.drop(entry)
+        self.files.clear()
+
+
+class FileResolver():
+    """Tier(s) holding each stored package file, so serving it doesn't look for it on disk."""
+
+    def __init__(self, files=()):
+        self.tiers = {}
+        for package, name, tier in files:
+            self.add(package, name, tier)
+
+    def add(self, package, name, tier):
+        self.tiers.setdefault((package, name), set()).add(tier)
+
+    def remove(self, package, name, tier):
+        tiers = self.tiers.get((package, name))
+        if tiers is None:
+            return
+
+        tiers.discard(tier)
+        if not tiers:
+            del self.tiers[(package, name)]
+
+    def get(self, package, name):
+        """Return list of tier holding the file, highest first."""
+        return sorted(self.tiers.get((package, name), ()), reverse=True)
+
+
+def parse_range(header, size):
+    """Parse a single ``Range: bytes=`` header into ``(start, end)``, end exclusive.
+
+    ``None`` is returned when the header is malformed or ask for several ranges, the whole file
+    is sent then. Range not satisfiable has ``start >= end``.
+    """
+    unit, _, byte_range = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in byte_range:
+        return None
+
+    start, _, end = byte_range.strip().partition('-')
+    try:
+        if not start:
+            # suffix range, last <end> byte(s)
+            length = int(end)
+            return max(size - length, 0) if length else size, size
+
+        start = int(start)
+        end = int(end) + 1 if end else None
+    except ValueError:
+        return None
+
+    if end is None:
+        end = size
+    elif end <= start:
+        # last byte before first byte is invalid
+        return None
+
+    return start, min(end, size)
+
+
+def match_if_range(if_range, etag, modified):
+    """Return whether an ``If-Range`` header still match the file of ``etag`` and ``modified`` time.
+
+    Range is only honoured when the header is missing or match.
+    """
+    if if_range is None:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+
+    date = email.utils.parsedate(if_range)
+    return date is not None and calendar.timegm(date) == modified
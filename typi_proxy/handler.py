@@ -3,49 +3,106 @@ Created on Aug 15, 2014
 
 @author: Azhar
 """
-import hashlib
-import pickle
-from collections import namedtuple, OrderedDict
-from os.path import getmtime, basename
-from time import time
-from urllib.parse import urljoin, urlsplit, parse_qs, urlunsplit, urlencode
+import calendar
+import datetime
+import email.utils
+import json
+import mimetypes
+import mmap
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import time, perf_counter
+from urllib.parse import urlencode
 
 import tornado.gen
+import tornado.ioloop
 import tornado.web
-from bs4 import BeautifulSoup
-from pathlib import Path
-from tornado.httpclient import AsyncHTTPClient
+from pathlib import Path, PurePosixPath
+from tornado.concurrent import Future
+from tornado.escape import utf8
+from tornado.iostream import IOStream, StreamClosedError
 from tornado.log import app_log
 
+from .crawler import Crawler, negative_ttl
+from .files import parse_range, match_if_range
+from .metadata import CACHE, UPLOAD
+from .pages import select_encoding
 from .streaming_upload import StreamingFormDataHandler
-from .util import Versioning, Checksum
+from .transload import Transload
+from .util import Versioning, PackageData, FileDigest
 
 
-PackageData = namedtuple('PackageData', ['name', 'md5', 'link', 'cache'])
+def is_file_name(name):
+    """Return whether ``name`` is a single visible path component, so it can't escape the directory it is joined to."""
+    return bool(name) and name == PurePosixPath(name).name and not name.startswith('.') and '\0' not in name
 
 
-class PypiHandler(StreamingFormDataHandler):
+class TimingMixin():
+    """Record time spent in each phase of the request.
+
+    Phases done when the header is sent are given in the ``Server-Timing`` header with
+    ``server.server_timing``, request slower than ``server.slow_request`` millisecond(s) are
+    logged with every phase by the application.
+    """
+
+    def initialize(self):
+        self.phases = OrderedDict()
+        self._phase_started = {}
+
+    def add_phase(self, name, duration):
+        self.phases[name] = self.phases.get(name, 0) + duration
+
+    @contextmanager
+    def timed(self, name):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, perf_counter() - started)
+
+    def start_phase(self, name):
+        """Start a phase spanning several callback, ended by ``end_phase``."""
+        self._phase_started[name] = perf_counter()
+
+    def end_phase(self, name):
+        started = self._phase_started.pop(name, None)
+        if started is not None:
+            self.add_phase(name, perf_counter() - started)
+
+    def server_timing(self):
+        timings = ['{};dur={:.2f}'.format(name, duration * 1000) for name, duration in self.phases.items()]
+        timings.append('total;dur={:.2f}'.format(self.request.request_time() * 1000))
+        return ', '.join(timings)
+
+    def flush(self, include_footers=False, callback=None):
+        if not self._headers_written and self.settings['server']['server_timing']:
+            self.set_header('Server-Timing', self.server_timing())
+        return tornado.web.RequestHandler.flush(self, include_footers, callback)
+
+
+class PypiHandler(TimingMixin, StreamingFormDataHandler):
+    """Store a package file uploaded by ``setup.py upload`` or twine.
+
+    Content is written and hashed by a ``StreamWriter`` as it is received, the body is only read
+    further while the disk keep up. The file is published once the whole body is received and
+    its digest checked against the ``md5_digest`` and ``sha256_digest`` sent with it.
+    """
+
     def prepare(self):
-        StreamingFormDataHandler.prepare(self)
+        self.application.metrics.active_streams.inc('upload')
 
         self._pkg_md5 = None
+        self._pkg_sha256 = None
         self._pkg_name = None
         self._pkg_file = None
+        self._pkg_part = None
         self._pkg_diggest = None
-        self._pkg_fd = None
-
-        self._need_md5 = False
-        self._need_rename = False
-
-    def write_md5(self):
-        app_log.debug('recv: %r -- send: %r', self._pkg_diggest.hexdigest(), self._pkg_md5)
-        if self._pkg_diggest.hexdigest() != self._pkg_md5:
-            raise tornado.web.HTTPError(417)
-
-        app_log.debug('write md5')
-        Checksum(self._pkg_file.parent).update(self._pkg_file, self._pkg_md5)
+        self._pkg_writer = None
+        self._pkg_error = None
 
-        self._need_md5 = False
+        self.request.connection.set_max_body_size(self.settings['server']['max_upload'] * 1024 * 1024)
+        StreamingFormDataHandler.prepare(self)
 
     def validate(self):
         pkg_file = self.application.get_upload_path() / self._pkg_name / self._pkg_file.name
@@ -55,427 +112,796 @@ class PypiHandler(StreamingFormDataHandler):
         setting = self.settings['package'].get(self._pkg_name, {})
         if not setting.get('update', True) and pkg_file.exists():
             app_log.warn('updating package %s not allowed', self._pkg_file.name)
-
-            if pkg_file != self._pkg_file and self._pkg_file.exists():
-                self._pkg_file.unlink()
-
             raise tornado.web.HTTPError(403)
 
         return pkg_file
 
+    def publish(self):
+        """Move the complete upload in place, concurrent upload of the same file never mix."""
+        pkg_file = self.validate()
+
+        app_log.debug('publish %s', pkg_file)
+        try:
+            pkg_file.parent.mkdir()
+        except FileExistsError:
+            pass
+
+        with self.timed('publish'):
+            self._pkg_part.replace(pkg_file)
+        self._pkg_file = pkg_file
+        self._pkg_part = None
+
     def on_content_begin(self, data):
         # filename = str(self._disp_params['filename'])
         filename = self._disp_params['filename']
+        if not is_file_name(filename):
+            app_log.warn('invalid package file name %r', filename)
+            raise tornado.web.HTTPError(400)
         if self._pkg_name is None:
             self._pkg_file = self.application.get_upload_path() / filename
-            self._need_rename = True
         else:
             self._pkg_file = self.application.get_upload_path() / self._pkg_name / filename
             self.validate()
 
-            if not self._pkg_file.parent.exists():
-                self._pkg_file.parent.mkdir()
-
         app_log.debug('begin handle content file %s', filename)
-        self._pkg_diggest = hashlib.md5()
-        self._pkg_fd = self._pkg_file.open('wb')
+        fd, self._pkg_part = self.application.create_part(self.application.get_upload_path() / filename)
+        self._pkg_diggest = FileDigest()
+        self._pkg_writer = self.application.stream_writer(os.fdopen(fd, 'wb'), [self._pkg_diggest])
         self.on_content_data(data)
 
     def on_content_data(self, data):
-        app_log.debug('write content %d byte(s) to %s', len(data), str(self._pkg_file))
-        self._pkg_fd.write(data)
-        self._pkg_diggest.update(data)
+        self._pkg_writer.write(data)
+        self.application.metrics.upload_bytes.inc(amount=len(data))
 
-    def on_name_end(self):
-        self._pkg_name = self.application.normalize_name(self._disp_buffer.decode())
-        if self._need_rename:
-            pkg_file = self.validate()
+    def data_received(self, data):
+        if self._pkg_error is not None:
+            # already rejected, rest of the body is dropped
+            return
 
-            app_log.debug('renaming file')
-            if not pkg_file.parent.exists():
-                pkg_file.parent.mkdir()
+        with self.timed('receive'):
+            try:
+                StreamingFormDataHandler.data_received(self, data)
+            except tornado.web.HTTPError as e:
+                # error raised while the body is read would only drop the connection, it is answered by post
+                self._pkg_error = e
+                return
 
-            self._pkg_file.rename(pkg_file)
+        # read the next chunk once the writer catch up
+        if self._pkg_writer is not None:
+            return self._pkg_writer.wait()
+
+    def on_name_end(self):
+        self._pkg_name = self.application.normalize_name(self._disp_buffer.decode())
+        if not is_file_name(self._pkg_name):
+            app_log.warn('invalid package name %r', self._pkg_name)
+            raise tornado.web.HTTPError(400)
 
     def on_md5_digest_end(self):
         self._pkg_md5 = self._disp_buffer.decode()
-        if self._need_md5:
-            app_log.debug('writing md5')
-            self.write_md5()
 
-    def on_content_end(self):
-        app_log.debug('finalize content')
-        self._pkg_fd.close()
-        self._pkg_fd = None
+    def on_sha256_digest_end(self):
+        self._pkg_sha256 = self._disp_buffer.decode()
 
-        if self._pkg_md5 is None:
-            self._need_md5 = True
-        else:
-            self.write_md5()
+    @tornado.gen.coroutine
+    def post(self):
+        if self._pkg_error is not None:
+            raise self._pkg_error
 
-    def on_finish(self):
-        if self._pkg_fd is not None:
-            self._pkg_fd.close()
+        if self._pkg_writer is None:
+            # no content received
+            return
 
-        # md5_digest content not found
-        if self._need_md5:
+        with self.timed('commit'):
+            yield self._pkg_writer.commit()
+
+        if self._pkg_name is None:
+            app_log.warn('package name of %s not received', self._pkg_file.name)
+            raise tornado.web.HTTPError(400)
+
+        if self._pkg_md5 is None and self._pkg_sha256 is None:
             app_log.warn('md5_digest disposition not found')
-            self._pkg_md5 = self._pkg_diggest.hexdigest()
-            self.write_md5()
 
+        app_log.debug('recv: %r %r -- send: %r %r', self._pkg_diggest.md5, self._pkg_diggest.sha256, self._pkg_md5,
+                      self._pkg_sha256)
+        for sent, received in [(self._pkg_md5, self._pkg_diggest.md5), (self._pkg_sha256, self._pkg_diggest.sha256)]:
+            if sent is not None and sent != received:
+                raise tornado.web.HTTPError(417)
 
-class CacheHandler(tornado.web.StaticFileHandler):
-    def initialize(self):
-        tornado.web.StaticFileHandler.initialize(self, str(self.application.get_upload_path()))
+        self.publish()
+
+        # writer is closed once the directory the part is renamed into is synced
+        with self.timed('publish'):
+            published = self._pkg_writer.published(self._pkg_file)
+            if published is not None:
+                yield published
+        yield self._pkg_writer.close()
+        self._pkg_writer = None
 
-    def set_extra_headers(self, path):
-        package_file = Path(path)
-        self.add_header('Content-Disposition', 'attachment; filename="{}"'.format(package_file.name))
+        app_log.debug('write digest')
+        with self.timed('metadata'):
+            self.application.add_file(self._pkg_name, self._pkg_file, UPLOAD, self._pkg_diggest)
 
-    def validate_absolute_path(self, root, absolute_path):
-        package_file = Path(absolute_path)
-        if not package_file.exists():
-            package_file = self.application.get_cache_path() / package_file.relative_to(
-                self.application.get_upload_path())
-            self.root = str(package_file.parent)
-        return tornado.web.StaticFileHandler.validate_absolute_path(self, self.root, str(package_file))
+    def on_finish(self):
+        metrics = self.application.metrics
+        metrics.active_streams.dec('upload')
+        metrics.upload_duration.observe(self.request.request_time())
+
+        if self._pkg_writer is not None:
+            # upload not complete
+            self._pkg_writer.close()
+
+        if self._pkg_part is not None and self._pkg_part.exists():
+            # upload not complete, rejected or package name never received
+            self._pkg_part.unlink()
+
+        if self._pkg_name is not None and self._pkg_part is None and self._pkg_file is not None:
+            self.application.pages.invalidate(self._pkg_name)
+            self.application.files.invalidate(self._pkg_file)
+
+
+class FileMixin():
+    """Send a package file from the open file cache.
+
+    Body is sent with ``os.sendfile`` straight from the page cache to the socket when the
+    connection is plain HTTP, or from a memory map of the file otherwise.
+    """
+    CHUNK_SIZE = 1024 * 1024
+
+    def split_path(self, path):
+        """Return ``(package, name)`` of a package file path, ``None`` if it isn't one."""
+        parts = PurePosixPath(path).parts
+        if len(parts) != 2 or not all(is_file_name(part) for part in parts) or \
+                parts[1].endswith(Transload.PART_SUFFIX):
+            return None
+        return parts
+
+    def open_file(self, path, probe=False):
+        """Open the stored package file at ``path``, return ``(entry, tier)``.
+
+        Tier holding the file comes from the resolver, disk is only looked at with ``probe`` for
+        file stored without metadata. ``(None, None)`` is returned when it isn't stored.
+        """
+        parts = self.split_path(path)
+        if parts is None:
+            return None, None
+
+        resolver = self.application.resolver
+        tiers = resolver.get(*parts)
+        if probe:
+            tiers += [tier for tier in (UPLOAD, CACHE) if tier not in tiers]
+
+        path = '/'.join(parts)
+        for tier in tiers:
+            package_file = self.application.get_package_path(tier, path)
+            if package_file is None:
+                return None, None
 
+            try:
+                entry = self.application.files.open(package_file)
+            except FileNotFoundError:
+                # removed behind our back
+                resolver.remove(parts[0], parts[1], tier)
+                continue
+            return entry, tier
 
-class RemoteHandler(tornado.web.RequestHandler):
-    def write_md5(self, file, md5=None):
-        app_log.debug('write md5 %s', file)
-        Checksum(file.parent).update(file, md5)
+        return None, None
 
-    @tornado.web.asynchronous
-    def get(self, path):
-        app_log.debug('proses %s', path)
-        cache_file = self.application.get_cache_path() / path
+    @tornado.gen.coroutine
+    def serve_file(self, entry, tier):
+        metrics = self.application.metrics
+        if tier == CACHE:
+            package_file = Path(entry.path)
+            self.application.evictor.touch(package_file.parent.name, package_file.name)
+            metrics.downloads.inc('cache')
+        else:
+            metrics.downloads.inc('upload')
 
-        upload_file = self.application.get_upload_path() / path
-        if upload_file.exists():
-            app_log.debug('found %s', upload_file)
-            self.write_md5(upload_file)
-            self.redirect(self.reverse_url('cache', path))
+        metrics.active_streams.inc('file')
+        self.start_phase('send')
+        try:
+            yield self.send_file(entry, tier)
+        finally:
+            self.end_phase('send')
+            metrics.active_streams.dec('file')
+            self.application.files.release(entry)
+
+    @tornado.gen.coroutine
+    def send_file(self, entry, tier):
+        if entry.etag is None:
+            # use digest stored on ingest instead of hashing the whole file
+            package_file = Path(entry.path)
+            data = self.application.metadata.get_file(package_file.parent.name, package_file.name, tier)
+            if data is not None and data.md5:
+                entry.etag = '"{}"'.format(data.md5)
+            else:
+                entry.etag = '"{:x}-{:x}"'.format(int(entry.mtime), entry.size)
+
+        modified = int(entry.mtime)
+        self.set_header('Etag', entry.etag)
+        self.set_header('Last-Modified', datetime.datetime.utcfromtimestamp(modified))
+        self.set_header('Accept-Ranges', 'bytes')
+        self.set_header('Content-Type', self.get_content_type(entry.path))
+        self.set_header('Content-Disposition', 'attachment; filename="{}"'.format(Path(entry.path).name))
+
+        if self.is_not_modified(modified):
+            self.set_status(304)
+            self.finish()
             return
 
-        if cache_file.exists():
-            app_log.debug('found %s', cache_file)
-            self.write_md5(cache_file)
-            self.redirect(self.reverse_url('cache', path))
+        start, end = 0, entry.size
+        header = self.request.headers.get('Range')
+        if header is not None and match_if_range(self.request.headers.get('If-Range'), entry.etag, modified):
+            byte_range = parse_range(header, entry.size)
+            if byte_range is not None:
+                start, end = byte_range
+                if start >= end:
+                    self.set_status(416)
+                    self.set_header('Content-Type', 'text/plain')
+                    self.set_header('Content-Range', 'bytes */{}'.format(entry.size))
+                    self.finish()
+                    return
+
+                self.set_status(206)
+                self.set_header('Content-Range', 'bytes {}-{}/{}'.format(start, end - 1, entry.size))
+
+        self.set_header('Content-Length', end - start)
+        if self.request.method == 'HEAD' or start == end:
+            self.finish()
             return
 
-        link = self.get_argument('link', None)
-        if link is None:
-            raise tornado.web.HTTPError(404)
+        try:
+            if self.can_sendfile():
+                yield self.sendfile(entry.fd, start, end - start)
+            else:
+                yield self.write_mmap(entry.fd, start, end)
+        except StreamClosedError:
+            app_log.debug('client connection close')
+            return
 
-        if not cache_file.parent.exists():
-            cache_file.parent.mkdir()
+        self.finish()
 
-        self._file = cache_file
-        self._md5 = hashlib.md5()
-        self._fd = cache_file.open('wb')
+    def get_content_type(self, path):
+        mime_type, encoding = mimetypes.guess_type(path)
+        if encoding == 'gzip':
+            return 'application/gzip'
+        if encoding is not None or mime_type is None:
+            return 'application/octet-stream'
+        return mime_type
 
-        app_log.debug('fetch %s', link)
+    def is_not_modified(self, modified):
+        if self.request.headers.get('If-None-Match'):
+            return self.check_etag_header()
 
-        client = AsyncHTTPClient()
-        client.fetch(link,
-                     request_timeout=self.application.settings['transload']['timeout'],
-                     header_callback=self.process_header,
-                     streaming_callback=self.process_body,
-                     callback=self.process_finish)
+        since = self.request.headers.get('If-Modified-Since')
+        if since:
+            date = email.utils.parsedate(since)
+            return date is not None and calendar.timegm(date) >= modified
 
-    def process_header(self, line):
-        header = line.strip()
-        # app_log.debug('header: %r', header)
-        if header:
-            if ':' not in header:
-                return
+        return False
 
-            key, val = [x.strip() for x in header.split(':', 1)]
-            if key.lower() in ['content-length', 'content-type']:
-                self.set_header(key, val)
-            return
+    def can_sendfile(self):
+        connection = self.request.connection
+        stream = getattr(connection, 'stream', None)
+        return (hasattr(os, 'sendfile') and type(stream) is IOStream and
+                hasattr(connection, '_expected_content_remaining') and
+                not self.settings.get('compress_response'))
 
-        self.add_header('Content-Disposition', 'attachment; filename="{}"'.format(self._file.name))
-        self.flush()
-        # app_log.debug('header finish')
+    @tornado.gen.coroutine
+    def sendfile(self, fd, offset, count):
+        connection = self.request.connection
+        stream = connection.stream
 
-    def process_body(self, chunk):
-        # app_log.debug('got %d byte(s) for %s', len(chunk), self._file)
-        self._md5.update(chunk)
-        self._fd.write(chunk)
-        self.write(chunk)
-        self.flush()
+        # header first, the connection write buffer is empty once it is flushed
+        yield self.flush()
 
-    def process_finish(self, response):
-        app_log.debug('%s done', self._file)
-        self.write_md5(self._file, self._md5.hexdigest())
-        self.finish()
+        while count:
+            if stream.closed():
+                raise StreamClosedError()
 
+            try:
+                sent = os.sendfile(stream.socket.fileno(), fd, offset, min(count, self.CHUNK_SIZE))
+            except BlockingIOError:
+                yield self.wait_writable(stream)
+                continue
+            except OSError as e:
+                app_log.debug('sendfile failed: %s', e)
+                stream.close()
+                raise StreamClosedError()
+
+            if not sent:
+                # file got shorter than its cached size
+                stream.close()
+                raise StreamClosedError()
+
+            offset += sent
+            count -= sent
+
+            # body bypass the connection, keep its Content-Length accounting in sync
+            connection._expected_content_remaining -= sent
+
+            yield tornado.gen.moment
+
+    def wait_writable(self, stream):
+        """Future resolved once the socket can be written again.
+
+        The stream own the registration of its socket on the IO loop, a duplicate of the
+        descriptor is watched instead.
+        """
+        future = Future()
+        ioloop = tornado.ioloop.IOLoop.current()
+        fd = os.dup(stream.socket.fileno())
+
+        def on_writable(fd, events):
+            ioloop.remove_handler(fd)
+            os.close(fd)
+            future.set_result(None)
+
+        ioloop.add_handler(fd, on_writable, ioloop.WRITE)
+        return future
+
+    @tornado.gen.coroutine
+    def write_mmap(self, fd, start, end):
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as data:
+            while start < end:
+                chunk = data[start:min(start + self.CHUNK_SIZE, end)]
+                start += len(chunk)
+                self.write(chunk)
+                yield self.flush()
+
+
+class CacheHandler(TimingMixin, FileMixin, tornado.web.RequestHandler):
+    @tornado.gen.coroutine
+    def get(self, path):
+        with self.timed('open'):
+            entry, tier = self.open_file(path, probe=True)
+        if entry is None:
+            raise tornado.web.HTTPError(404)
 
-class SimpleHandler(tornado.web.RequestHandler):
-    @tornado.web.addslash
-    @tornado.web.asynchronous
-    def get(self):
-        packages = []
-        for file in self.application.get_upload_path().iterdir():
-            packages.append(file.name)
+        yield self.serve_file(entry, tier)
 
-        for file in self.application.get_cache_path().iterdir():
-            if file.name not in packages:
-                packages.append(file.name)
+    head = get
 
-        packages.sort(key=str.lower)
 
-        self.write('''\
-<html>
-<head>
-    <title>Cached and uploaded packages</title>
-</head>
-<body>''')
+class RemoteHandler(TimingMixin, FileMixin, tornado.web.RequestHandler):
+    @tornado.gen.coroutine
+    def get(self, path):
+        app_log.debug('proses %s', path)
+        parts = self.split_path(path)
+        if parts is None:
+            raise tornado.web.HTTPError(404)
 
-        for package in packages:
-            self.write('''\
-<a href="{url}">{name}</a><br>'''.format(
-                url=self.reverse_url('package', package)[:-1],
-                name=package
-            ))
+        path = '/'.join(parts)
+        if self.application.get_package_path(CACHE, path) is None:
+            raise tornado.web.HTTPError(404)
 
-        self.finish('''\
-</body>
-</html>
-        ''')
+        self._transload = self.application.transloads.get(path)
 
+        with self.timed('open'):
+            entry, tier = self.open_file(path)
+            if entry is None and self._transload is None:
+                # unknown to the resolver, look on disk for file stored without metadata
+                entry, tier = self.open_file(path, probe=True)
 
-class PackageHandler(tornado.web.RequestHandler):
-    source_extensions = ('.tar.gz', '.tar.bz2', '.tar', '.zip', '.tgz', '.tbz', '.tbz2',)
-    binary_extensions = ('.egg', '.exe', '.msi', '.whl',)
-    others_extensions = ('.pybundle',)
+        if entry is not None:
+            app_log.debug('found %s', entry.path)
+            self._transload = None
+            yield self.serve_file(entry, tier)
+            return
 
-    extensions = source_extensions + binary_extensions + others_extensions
+        if self._transload is None:
+            link = self.get_argument('link', None)
+            if link is None:
+                raise tornado.web.HTTPError(404)
 
-    def prepare(self):
-        self.reload_only = False
-        self.cfg = self.application.settings['index']
+            self._transload = Transload(self.application, path, link)
+            self._transload.start()
+        else:
+            app_log.debug('join transload %s', path)
+
+        self.application.metrics.downloads.inc('transload')
+
+        self._offset = 0
+        self._waiter = None
+        self._streaming = False
+        self._done = Future()
+        self.start_phase('upstream')
+        self._transload.attach(self)
+
+        # response is given by the transload callbacks, request is done once it is finished or dropped
+        yield self._done
+
+    def on_transload_header(self, transload):
+        self.end_phase('upstream')
+        for key, val in transload.headers:
+            self.set_header(key, val)
+        self.add_header('Content-Disposition', 'attachment; filename="{}"'.format(transload.file.name))
+
+        self._streaming = True
+        self.application.metrics.active_streams.inc('transload')
+        self.start_phase('stream')
+        self.stream_file()
+
+    def on_transload_data(self, transload):
+        if self._waiter is not None:
+            self._waiter.set_result(None)
+            self._waiter = None
+
+    def on_transload_finish(self, transload):
+        if transload.error is not None and not self._headers_written:
+            self.send_error(502)
+            return
 
-    def is_archive(self, url):
-        if url is None:
-            return False
+        self.on_transload_data(transload)
 
-        url = urlsplit(url.lower()).path
-        urls = url.rsplit('/')
-        if urls:
-            url = urls[-1]
+    @tornado.gen.coroutine
+    def stream_file(self):
+        """Send the transloaded file from disk as fast as the client read it.
 
-        return url.endswith(self.extensions) and url.replace('-', '_').startswith(self.package_name)
+        Only ``transload.watermark`` byte(s) are kept in the connection buffer at a time, the
+        rest stay on disk until the client catch up, so slow client doesn't hold the whole
+        file in memory nor slow down the transload.
+        """
+        transload = self._transload
+        watermark = self.settings['transload']['watermark']
 
-    def add_version(self, name, md5, url, href):
-        if name in self.package_versions:
-            return
+        complete = False
+        try:
+            # part is opened before anything is yielded, it may be published meanwhile
+            with transload.part.open('rb') as f:
+                yield self.flush()
+
+                while transload.error is None:
+                    if self._offset < transload.size:
+                        f.seek(self._offset)
+                        chunk = f.read(min(watermark, transload.size - self._offset))
+                        self._offset += len(chunk)
+                        self.write(chunk)
+                        yield self.flush()
+                    elif transload.done:
+                        break
+                    else:
+                        self._waiter = Future()
+                        yield self._waiter
+
+            complete = transload.error is None
+        except StreamClosedError:
+            app_log.debug('client connection close')
+        finally:
+            if not complete:
+                # clean up before the request is finished on the dropped connection, so it is logged with the
+                # stream phase
+                self.on_connection_close()
+                self.request.connection.close()
 
-        app_log.debug('add %s', href)
+        self.end_phase('stream')
+        if complete and not self._finished:
+            self.finish()
 
-        data = PackageData(name, md5, url, 0)
-        self.package_versions[data.name] = data
+    def on_connection_close(self):
+        if getattr(self, '_transload', None) is not None:
+            self._transload.detach(self)
 
-        if data.name in self.local_versions:
-            data = PackageData(*data[:-1], cache=-1)
-        self.write_upstream(data)
+        if getattr(self, '_streaming', False):
+            self._streaming = False
+            self.application.metrics.active_streams.dec('transload')
+            self.end_phase('stream')
 
-    def add_link(self, url, split, base, href):
-        if self._finished or self.depth >= self.cfg['depth']:
-            return
+        if getattr(self, '_done', None) is not None and not self._done.done():
+            self._done.set_result(None)
 
-        strip_url = urlunsplit((split.scheme, split.netloc, split.path, None, None))
-        if strip_url in self.visited_links:
-            return
-        self.visited_links.add(strip_url)
+    def on_finish(self):
+        self.on_connection_close()
+
+
+class SimpleApiMixin():
+    """Content negotiation between the HTML and JSON (PEP 691) form of the simple API."""
+    CONTENT_TYPES = OrderedDict([
+        ('application/vnd.pypi.simple.v1+json', 'json'),
+        ('application/vnd.pypi.simple.latest+json', 'json'),
+        ('application/vnd.pypi.simple.v1+html', 'html'),
+        ('application/vnd.pypi.simple.latest+html', 'html'),
+        ('text/html', 'html'),
+    ])
+    JSON_CONTENT_TYPE = 'application/vnd.pypi.simple.v1+json'
+    HTML_CONTENT_TYPE = 'application/vnd.pypi.simple.v1+html'
+    API_VERSION = '1.0'
+
+    def select_format(self):
+        content_type = self.get_argument('format', None)
+        if content_type is not None:
+            if content_type not in self.CONTENT_TYPES:
+                raise tornado.web.HTTPError(406)
+        else:
+            content_type = self.negotiate(self.request.headers.get('Accept', 'text/html'))
+            if content_type is None:
+                raise tornado.web.HTTPError(406)
+
+        self.add_header('Vary', 'Accept')
+        if self.application.pages.encodings:
+            # cached page is served compressed when the client accept it
+            self.add_header('Vary', 'Accept-Encoding')
+
+        # answered with the concrete version rather than latest, and set for each request as the cached page is
+        # shared by every type of its format
+        fmt = self.CONTENT_TYPES[content_type]
+        if content_type == 'text/html':
+            self.set_header('Content-Type', 'text/html; charset=UTF-8')
+        elif fmt == 'json':
+            self.set_header('Content-Type', self.JSON_CONTENT_TYPE)
+        else:
+            self.set_header('Content-Type', self.HTML_CONTENT_TYPE)
 
-        if split.netloc != base.netloc or not split.path.startswith(base.path):
-            return
-        app_log.debug('found %s', href)
-        self.links.append((url, self.depth + 1))
+        return fmt
 
-    def parse_remote(self, response):
-        if self._finished:
-            app_log.info('connection canceled')
-            return
+    def negotiate(self, accept):
+        order = list(self.CONTENT_TYPES)
 
-        try:
-            if response.code != 200:
-                app_log.warning('Error while getting remote %s '
-                                'Errors details: (%s: %s) %s', response.effective_url,
-                                response.code, response.reason, response.body)
-                return
+        best, best_q = None, 0
+        for media_range in accept.split(','):
+            media_type, _, params = media_range.partition(';')
+            media_type = media_type.strip().lower()
 
-            base_url = response.effective_url
-            base = urlsplit(base_url)
+            q = 1.0
+            for param in params.split(';'):
+                key, _, value = param.strip().partition('=')
+                if key == 'q':
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0
 
-            content_type = response.headers.get('content-type', '')
-            if content_type in ('application/x-gzip',):
-                # in this case the URL was a redirection to download
-                # a package. For example, sourceforge.
-                self.add_version(basename(base.path), '', base_url, base_url)
-                return
+            if media_type in ('*/*', 'text/*'):
+                media_type = 'text/html'
+            elif media_type == 'application/*':
+                media_type = self.JSON_CONTENT_TYPE
 
-            if not response.body:
-                return
+            if media_type not in self.CONTENT_TYPES or q <= 0:
+                continue
 
-            app_log.debug('parse %s', base_url)
+            if q > best_q or (q == best_q and order.index(media_type) < order.index(best)):
+                best, best_q = media_type, q
 
-            soup = BeautifulSoup(response.body)
-            for anchor in soup.find_all('a'):
-                href = anchor.get('href')
-                if not href:
-                    continue
+        return best
 
-                current_url = urljoin(base_url, href)
-                current = urlsplit(current_url)
+    def write_page(self, page):
+        body, etag = page.body, page.etag
+        if self.application.pages.encodings:
+            encoding = select_encoding(self.request.headers.get('Accept-Encoding', ''), page.encodings)
+            if encoding is not None:
+                body, etag = page.encodings[encoding]
+                self.set_header('Content-Encoding', encoding)
 
-                if self.is_archive(current.path):
-                    self.add_version(basename(current.path), '', current_url, href)
-                else:
-                    self.add_link(current_url, current, base, href)
-        finally:
-            self.fetch_next()
-
-    def parse_index(self, response):
-        if response.code != 200:
-            app_log.warning('Error while getting index %s '
-                            'Errors details: (%s: %s) %s', response.effective_url,
-                            response.code, response.reason, response.body)
-            self.finalize_upstream()
-            return
+        self.set_header('Etag', etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+        else:
+            self.finish(body)
 
-        if self._finished:
-            app_log.info('connection canceled')
-            return
+    def render_json(self, data, meta=None):
+        meta = OrderedDict([('api-version', self.API_VERSION)] +
+                           [(k, v) for k, v in (meta or {}).items() if v is not None])
+        data = OrderedDict([('meta', meta)] + list(data.items()))
+        return json.dumps(data)
 
-        base_url = response.effective_url
-        app_log.debug('parse %s', base_url)
+    def write_json(self, data, meta=None):
+        self.write(self.render_json(data, meta))
 
-        self.package_versions = OrderedDict()
-        self.visited_links = set()
 
-        soup = BeautifulSoup(response.body)
+class SimpleHandler(TimingMixin, SimpleApiMixin, tornado.web.RequestHandler):
+    PAGE_KEY = '/'
 
-        for panchor in soup.find_all('a'):
-            if panchor.get('rel') and panchor.get('rel')[0] == 'homepage':
-                # skip getting information on the project homepage
-                continue
+    @tornado.web.addslash
+    @tornado.web.asynchronous
+    def get(self):
+        fmt = self.select_format()
+
+        pages = self.application.pages
+        page = pages.get(self.PAGE_KEY, fmt)
+        if page is None:
+            version = pages.version(self.PAGE_KEY)
+            with self.timed('render'):
+                body = utf8(self.render_index(fmt))
+            page = pages.put(self.PAGE_KEY, fmt, version, body)
 
-            href = panchor.get('href')
-            href = urljoin(base_url, href)
-            url = urlsplit(href)
+        self.write_page(page)
 
-            if self.is_archive(url.path):
-                pkg_name = basename(url.path)
+    def render_index(self, fmt):
+        packages = self.application.packages
 
-                md5 = None
-                if url.fragment:
-                    fragment = parse_qs(url.fragment)
-                    if 'md5' in fragment:
-                        md5 = fragment['md5'][0]
+        if fmt == 'json':
+            return self.render_json({'projects': [{'name': package} for package in packages]})
 
-                self.add_version(pkg_name, md5, href, href)
+        lines = ['''\
+<html>
+<head>
+    <title>Cached and uploaded packages</title>
+</head>
+<body>''']
 
-            elif href not in self.visited_links and self.cfg['depth'] > 0:
-                app_log.debug('found %s', href)
-                self.links.append((href, 1))
-                self.visited_links.add(href)
+        for package in packages:
+            lines.append('''\
+<a href="{url}">{name}</a><br>'''.format(
+                url=self.reverse_url('package', package)[:-1],
+                name=package
+            ))
 
-        self.fetch_next()
+        lines.append('''\
+</body>
+</html>
+        ''')
+        return ''.join(lines)
 
-    def fetch_index(self, package_name, local_versions):
-        index_url = None
-        if self.settings['package']:
-            index_url = self.settings['package'].get(package_name, {}).get('base')
 
-        if not index_url:
-            index_url = self.cfg['base']
+class PackageHandler(TimingMixin, SimpleApiMixin, tornado.web.RequestHandler):
+    TIERS = {2: 'upload', 1: 'cache', 0: 'upstream'}
 
-        if not index_url:
-            self.finalize_upstream()
-            return
+    def prepare(self):
+        self.reload_only = False
+        self.format = 'html'
+        self.files = []
+        self.cfg = self.application.settings['index']
+        self.crawler = None
+        self.cache_expire = None
+        self.upstream_status = None
+        self._rendered = None
+        self._page_version = None
 
-        self.links = []
-        self.depth = 0
+    def fetch_index(self, package_name, local_versions):
         self.local_versions = local_versions
-        self.client = AsyncHTTPClient()
+        self.start_phase('upstream')
 
-        url = urljoin(index_url, package_name + '/')
-        if not url.endswith('/'):
-            url += '/'
+        self.crawler = self.application.crawls.get(package_name)
+        if self.crawler is None:
+            self.crawler = Crawler(self.application, package_name)
+            self.crawler.start()
+        else:
+            app_log.debug('join crawl %s', package_name)
+        self.crawler.attach(self)
 
-        app_log.debug('fetch %s', url)
-        self.client_fetch = self.client.fetch(url, callback=self.parse_index)
+    def on_crawl_version(self, crawler, data):
+        if data.name in self.local_versions:
+            data = data._replace(cache=-1)
 
-    def fetch_next(self):
-        if self._finished:
-            return
+        with self.timed('render'):
+            self.write_upstream(data)
 
-        while self.links:
-            if not self.reload_only:
-                self.flush()
+    def on_crawl_page(self, crawler):
+        if not self.reload_only and self.format == 'html' and not self._finished:
+            self.flush()
+
+    def on_crawl_finish(self, crawler):
+        self.crawler = None
+        self.upstream_status = crawler.code
+        if crawler.invalidated is not None and self._page_version == crawler.invalidated[0]:
+            # page rendered from the crawl, unless something else invalidated it meanwhile
+            self._page_version = crawler.invalidated[1]
+
+        self.end_phase('upstream')
+        self.add_phase('parse', crawler.parse_time)
+
+        ttl = negative_ttl(self.cfg, crawler.code)
+        if crawler.code == 200 and not crawler.expired:
+            self.cache_expire = time() + self.cfg['lifetime'] * 60 * 60
+        elif ttl is not None:
+            self.cache_expire = time() + ttl
+        self.finalize_upstream()
 
-            url, depth = self.links.pop(0)
-            app_log.debug('fetch %s', url)
+    def write(self, chunk):
+        if self._rendered is not None:
+            self._rendered.append(utf8(chunk))
+        tornado.web.RequestHandler.write(self, chunk)
 
-            self.depth = depth
-            self.client_fetch = self.client.fetch(url, callback=self.parse_remote)
-            break
-        else:
-            self.finalize_upstream()
+    def store_page(self):
+        if self._rendered is None or self.cache_expire is None or self.get_status() != 200:
+            return
 
-            app = self.application
-            package_path = app.get_cache_path(self.package_name)
-            self.save_cache(package_path, list(self.package_versions.values()))
+        self.application.pages.put(self.package_name, self.format, self._page_version, b''.join(self._rendered),
+                                   self.cache_expire)
+        self._rendered = None
 
     def load_local(self, package_name):
         files = {}
 
-        for cache, package_folder in [(1, self.application.get_cache_path(package_name)),
-                                      (2, self.application.get_upload_path(package_name))]:
-            if not package_folder.exists():
-                continue
-
-            app_log.info('loading package %s in %s', package_name, package_folder)
-
-            checksum = Checksum(package_folder)
-            for md5, name in checksum.iter():
-                data = PackageData(name, md5, None, cache)
-                files[name] = data
+        # uploaded file take precedence over cached one
+        for data in sorted(self.application.metadata.files(package_name), key=lambda data: data.tier):
+            files[data.name] = PackageData(data.name, data.md5, None, data.tier, data.sha256)
 
         return list(files.values())
 
-    def load_cache(self, package_path):
-        lifetime = self.application.settings['index']['lifetime'] * 60 * 60
-
-        cache_file = package_path / '.cache'
-        if cache_file.exists() and (time() - getmtime(str(cache_file))) <= lifetime:
-            try:
-                with cache_file.open('rb') as f:
-                    return pickle.load(f)
-            except:
-                pass
-        return None
-
-    def save_cache(self, package_path, versions):
-        cache_file = package_path / '.cache'
-        if not package_path.exists():
-            package_path.mkdir()
-
-        with cache_file.open('wb') as f:
-            pickle.dump(versions, f)
-
-        return versions
+    def load_cache(self, package_name):
+        """Load upstream index saved by the crawler.
+
+        Index older than ``index.lifetime`` hour(s) is still given until ``index.stale`` hour(s),
+        while a refresh crawl replace it in the background. Upstream miss or error is given as an
+        empty index until the ``index.negative`` ttl expire, though stale index is preferred over
+        an upstream error.
+        """
+        lifetime = self.cfg['lifetime'] * 60 * 60
+        stale = self.cfg['stale'] * 60 * 60
+
+        listing = self.application.metadata.load_listing(package_name)
+        if listing is None:
+            return None
+
+        now = time()
+        ttl = negative_ttl(self.cfg, listing.status)
+        if ttl is not None and now - listing.fetched <= ttl:
+            if (listing.updated is not None and listing.status >= 500 and
+                    now - listing.updated <= max(lifetime, stale)):
+                # keep the stale index until upstream recover
+                return listing.versions
+
+            self.upstream_status = listing.status
+            self.cache_expire = listing.fetched + ttl
+            return []
+
+        if listing.updated is None or now - listing.updated > max(lifetime, stale):
+            return None
+
+        if now - listing.updated <= lifetime:
+            self.upstream_status = 200
+            self.cache_expire = listing.updated + lifetime
+        elif package_name not in self.application.crawls:
+            app_log.info('refresh stale index of %s', package_name)
+            Crawler(self.application, package_name, refresh=True).start()
+
+        return listing.versions
 
     @tornado.web.addslash
     @tornado.web.asynchronous
     def get(self, package_name):
         app = self.application
         package_name = app.normalize_name(package_name)
-        package_path = app.get_cache_path(package_name)
+
+        self.package_name = package_name
+        self.format = self.select_format()
+
+        page = app.pages.get(package_name, self.format)
+        if page is not None:
+            app.metrics.index_requests.inc('rendered')
+            self.write_page(page)
+            return
+
+        self._page_version = app.pages.version(package_name)
+        self._rendered = []
+
+        with self.timed('load_local'):
+            local_versions = self.load_local(package_name)
+
+        with self.timed('sort'):
+            local_versions.sort(key=lambda v: Versioning(v.name), reverse=True)
+
+        with self.timed('render'):
+            if self.format == 'json':
+                for cache in [2, 1]:
+                    for data in local_versions:
+                        if data.cache == cache:
+                            self.add_file(data, self.reverse_url('cache', '/'.join([package_name, data.name])))
+            else:
+                self.write_local(local_versions)
+
+        local_versions = {x.name for x in local_versions}
+
+        with self.timed('load_cache'):
+            versions = self.load_cache(package_name)
+        if versions is None:
+            app.metrics.index_requests.inc('upstream')
+            self.fetch_index(package_name, local_versions)
+            return
+
+        app.metrics.index_requests.inc('cache')
+
+        with self.timed('render'):
+            for data in versions:
+                if data.name in local_versions:
+                    data = data._replace(cache=-1)
+                self.write_upstream(data)
+
+        self.finalize_upstream()
+
+    def write_local(self, local_versions):
+        package_name = self.package_name
 
         self.write('''\
 <html>
@@ -484,9 +910,6 @@ class PackageHandler(tornado.web.RequestHandler):
 </head>
 <body>'''.format(package_name=package_name))
 
-        local_versions = self.load_local(package_name)
-        local_versions.sort(key=lambda v: Versioning(v.name), reverse=True)
-
         for cache, title in [(2, 'Uploaded'),
                              (1, 'Cached')]:
             self.write('''
@@ -498,9 +921,9 @@ class PackageHandler(tornado.web.RequestHandler):
 
                 self.write('''
     <li>
-        <a href="{url}#md5={md5}">{name}</a>
+        <a href="{url}{fragment}">{name}</a>
     </li>'''.format(url=self.reverse_url('cache', '/'.join([package_name, data.name])),
-                    md5=data.md5,
+                    fragment=self.hash_fragment(data),
                     name=data.name))
 
             self.write('''
@@ -516,21 +939,26 @@ class PackageHandler(tornado.web.RequestHandler):
 <ul>''')
         self.flush()
 
-        local_versions = {x.name for x in local_versions}
-
-        self.package_name = package_name
-
-        versions = self.load_cache(package_path)
-        if versions is None:
-            self.fetch_index(package_name, local_versions)
-            return
-
-        for data in versions:
-            if data.name in local_versions:
-                data = PackageData(*data[:-1], cache=-1)
-            self.write_upstream(data)
-
-        self.finalize_upstream()
+    def hash_fragment(self, data):
+        if data.sha256:
+            return '#sha256=' + data.sha256
+        if data.md5:
+            return '#md5=' + data.md5
+        return ''
+
+    def add_file(self, data, url):
+        hashes = OrderedDict()
+        if data.sha256:
+            hashes['sha256'] = data.sha256
+        if data.md5:
+            hashes['md5'] = data.md5
+
+        self.files.append(OrderedDict([
+            ('filename', data.name),
+            ('url', url),
+            ('hashes', hashes),
+            ('_tier', self.TIERS[data.cache]),
+        ]))
 
     def write_upstream(self, data):
         if self.reload_only:
@@ -542,12 +970,23 @@ class PackageHandler(tornado.web.RequestHandler):
             else:
                 name = data.name
 
+            url = '{url}?{link}'.format(url=self.reverse_url('remote', '/'.join([self.package_name, name])),
+                                        link=urlencode({'link': data.link}))
+
+            if self.format == 'json':
+                self.add_file(data, url)
+                return
+
+            # digest given by upstream let pip check the transloaded file
             self.write('''
     <li>
-        <a href="{url}?{link}">{name}</a>
-    </li>'''.format(url=self.reverse_url('remote', '/'.join([self.package_name, name])),
-                    link=urlencode({'link': data.link}),
+        <a href="{url}{fragment}">{name}</a>
+    </li>'''.format(url=url,
+                    fragment=self.hash_fragment(data),
                     name=data.name))
+        elif self.format == 'json':
+            # already listed as uploaded or cached file
+            return
         else:
             self.write('''
     <li>
@@ -559,12 +998,26 @@ class PackageHandler(tornado.web.RequestHandler):
             return
 
         if self.reload_only:
+            self.application.pages.invalidate(self.package_name)
             self.redirect(self.reverse_url('package', self.package_name)[:-1])
+            return
+
+        if self.format == 'json':
+            self.write_json(OrderedDict([('name', self.package_name), ('files', self.files)]),
+                            {'_upstream-status': self.upstream_status})
+            self.finish()
         else:
+            if self.upstream_status not in (None, 200):
+                self.write('''
+    <li data-upstream-status="{code}">
+        upstream returned {code}
+    </li>'''.format(code=self.upstream_status))
+
             self.finish('''
 </ul>
 </body>
 </html>''')
+        self.store_page()
 
     @tornado.web.asynchronous
     def post(self, package_name):
@@ -577,4 +1030,13 @@ class PackageHandler(tornado.web.RequestHandler):
 
     def on_connection_close(self):
         app_log.debug('client connection close')
+        if self.crawler is not None:
+            self.crawler.detach(self)
+            self.crawler = None
         self.finish()
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(self.application.metrics.render())
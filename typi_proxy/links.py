@@ -0,0 +1,84 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import re
+from html import unescape
+from html.parser import HTMLParser
+
+
+class AnchorParser(HTMLParser):
+    """Collect attributes of every ``<a>`` tag, everything else on the page is skipped."""
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.anchors = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self.anchors.append({k: v or '' for k, v in attrs})
+
+
+def extract_html(body):
+    parser = AnchorParser()
+    parser.feed(body)
+    parser.close()
+    return parser.anchors
+
+
+# comment is matched to be skipped, ``>`` inside a quoted attribute value doesn't end the tag
+ANCHOR_RE = re.compile(r'''<!--.*?-->|<a\s((?:[^>"']|"[^"]*"|'[^']*')*)>''', re.IGNORECASE | re.DOTALL)
+ATTR_RE = re.compile(r'''([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?''')
+
+
+def extract_regex(body):
+    anchors = []
+    for match in ANCHOR_RE.finditer(body):
+        if match.group(1) is None:
+            continue
+
+        attrs = {}
+        for name, dquote, squote, bare in ATTR_RE.findall(match.group(1)):
+            attrs.setdefault(name.lower(), unescape(dquote or squote or bare))
+        anchors.append(attrs)
+    return anchors
+
+
+def extract_bs4(body):
+    from bs4 import BeautifulSoup
+
+    anchors = []
+    for anchor in BeautifulSoup(body, 'html.parser').find_all('a'):
+        # multi valued attribute such as rel are given as list
+        anchors.append({k: ' '.join(v) if isinstance(v, list) else v for k, v in anchor.attrs.items()})
+    return anchors
+
+
+EXTRACTORS = {
+    'html': extract_html,
+    'regex': extract_regex,
+    'bs4': extract_bs4,
+}
+
+
+def get_extractor(name):
+    """Return function extracting list of ``<a>`` attribute dict from a page text."""
+    try:
+        return EXTRACTORS[name]
+    except KeyError:
+        raise Exception('unknown link parser {}, use one of {}'.format(name, ', '.join(sorted(EXTRACTORS))))
+
+
+def decode_body(response):
+    charset = 'utf-8'
+    content_type = response.headers.get('content-type', '')
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key.lower() == 'charset' and value:
+            charset = value.strip('"')
+
+    try:
+        return response.body.decode(charset, 'replace')
+    except LookupError:
+        return response.body.decode('utf-8', 'replace')
@@ -7,18 +7,34 @@ import argparse
 import logging
 import logging.config
 import os
-from datetime import timedelta
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import time
 
 import pathlib
+import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
 import tornado.web
 import yaml
 from pathlib import Path
 from tornado.log import app_log
 
 from . import template, yaml_anydict
-from .handler import SimpleHandler, PackageHandler, CacheHandler, RemoteHandler, PypiHandler
-from .util import Checksum, LoaderMapAsOrderedDict
+from .calculate import Calculator
+from .eviction import Evictor, select_evictions
+from .files import FileCache, FileResolver
+from .handler import SimpleHandler, PackageHandler, CacheHandler, RemoteHandler, PypiHandler, MetricsHandler
+from .metadata import MetadataStore, PackageIndex, UPLOAD
+from .metrics import Metrics
+from .pages import PageCache
+from .upstream import UpstreamClient
+from .transload import Transload
+from .util import LoaderMapAsOrderedDict
+from .writer import StreamWriter, FSYNC_POLICIES, get_file_mode
 
 
 logging.basicConfig()
@@ -28,6 +44,12 @@ CONFIG_FILENAME = 'typi-proxy.yml'
 
 
 class Application(tornado.web.Application):
+    # second(s) between check for change made by other process
+    SYNC_INTERVAL = 1
+
+    # second(s) change is kept for other process to see it
+    CHANGE_LIFETIME = 3600
+
     def __init__(self, cfg, debug=False):
         handlers = [
             (r"/simple/?", SimpleHandler),
@@ -35,12 +57,72 @@ class Application(tornado.web.Application):
             (r"/package/cache/(.+)", CacheHandler, {}, 'cache'),
             (r"/package/remote/(.+)", RemoteHandler, {}, 'remote'),
             (r"/pypi/?", PypiHandler),
+            (r"/metrics", MetricsHandler),
         ]
 
         tornado.web.Application.__init__(self, handlers,
                                          debug=debug,
                                          **cfg)
 
+        # digest of every package file and upstream index by package name
+        self.metadata = MetadataStore(self.get_metadata_path())
+        if self.metadata.created:
+            self.metadata.import_legacy(self.get_cache_path(), self.get_upload_path())
+
+        # counter of cache, upstream and upload activity
+        self.metrics = Metrics()
+
+        # pooled client for every request to upstream
+        self.upstream = UpstreamClient(self.settings['upstream'], self.metrics)
+
+        # transload in progress by package path, shared among concurrent request
+        self.transloads = {}
+
+        # upstream crawl in progress by package name
+        self.crawls = {}
+
+        # rendered index page by package name
+        self.pages = PageCache(self.settings['index']['pages'], self.settings['index']['compress'] or [])
+
+        # thread(s) writing and hashing uploaded and transloaded package file
+        if self.settings['writer']['fsync'] not in FSYNC_POLICIES:
+            raise Exception('unknown fsync policy {}, use one of {}'.format(self.settings['writer']['fsync'],
+                                                                            ', '.join(FSYNC_POLICIES)))
+        self.writers = ThreadPoolExecutor(self.settings['writer']['threads'])
+
+        # mode of stored package file, so it can be read by other user as before
+        self.file_mode = get_file_mode()
+
+        # open package file served by the cache route
+        self.files = FileCache(self.settings['serve']['open_files'])
+
+        # tier holding each stored package file
+        self.resolver = FileResolver(self.metadata.locations())
+
+        # name of package with a recorded file, listed on the simple index
+        self.packages = PackageIndex(self.metadata.packages())
+
+        # keep the cache tree under its size budget
+        self.evictor = Evictor(self)
+
+        # last change of the metadata store seen, written by other worker or command
+        self._data_version = self.metadata.data_version()
+        self._change_id = self.metadata.last_change()
+        self._pruned = time()
+        self._sync = None
+
+    def create_part(self, file):
+        """Create a part file next to ``file`` only the caller write to, return ``(fd, path)``."""
+        fd, part = tempfile.mkstemp(prefix='.{}.'.format(file.name), suffix=Transload.PART_SUFFIX,
+                                    dir=str(file.parent))
+        if hasattr(os, 'fchmod'):
+            # mkstemp create the file only readable by its owner
+            os.fchmod(fd, self.file_mode)
+        return fd, Path(part)
+
+    def stream_writer(self, fd, digests=(), on_written=None):
+        return StreamWriter(self.writers, self.settings['writer'], fd, digests, on_written)
+
     def get_cache_path(self, package_name=None):
         base = pathlib.Path(self.settings['path']['cache'])
         if package_name:
@@ -53,6 +135,114 @@ class Application(tornado.web.Application):
             return base / package_name
         return base
 
+    def get_tier_path(self, tier, package_name=None):
+        if tier == UPLOAD:
+            return self.get_upload_path(package_name)
+        return self.get_cache_path(package_name)
+
+    def get_package_path(self, tier, path):
+        """Return path of the package file ``<package>/<name>`` in ``tier``, ``None`` if it is anywhere else."""
+        base = self.get_tier_path(tier)
+        package_file = base / path
+        if package_file.parent.parent != base:
+            return None
+        return package_file
+
+    def add_file(self, package_name, file, tier, digest, link=None):
+        """Record package file stored by an upload or a transload with its ``FileDigest``."""
+        self.metadata.add_file(package_name, file.name, tier, digest.md5, digest.size, file.stat().st_mtime, link,
+                               digest.sha256)
+        self.update_file(package_name, file.name, tier, True)
+
+    def remove_file(self, package_name, name, tier):
+        """Remove stored package file and everything derived from it."""
+        file = self.get_tier_path(tier, package_name) / name
+        try:
+            file.unlink()
+        except FileNotFoundError:
+            pass
+
+        self.metadata.remove_file(package_name, name, tier)
+
+        # drop package directory left empty
+        try:
+            file.parent.rmdir()
+        except OSError:
+            pass
+
+        self.update_file(package_name, name, tier, False)
+
+    def update_file(self, package_name, name, tier, stored):
+        """Bring in-memory state in line with the package file being stored or removed."""
+        if stored:
+            self.resolver.add(package_name, name, tier)
+            self.add_package(package_name)
+        else:
+            self.resolver.remove(package_name, name, tier)
+            if not self.get_upload_path(package_name).exists() and not self.get_cache_path(package_name).exists():
+                self.remove_package(package_name)
+
+        self.files.invalidate(self.get_tier_path(tier, package_name) / name)
+        self.pages.invalidate(package_name)
+
+    def sync(self):
+        """Apply change made to the metadata store by other worker or command."""
+        version = self.metadata.data_version()
+        if version == self._data_version:
+            return
+        self._data_version = version
+
+        for change in self.metadata.changes(self._change_id):
+            self._change_id = change.id
+            if change.pid == self.metadata.pid:
+                continue
+
+            if change.name is None:
+                # upstream index fetched by another worker
+                self.pages.invalidate(change.package)
+            else:
+                stored = self.metadata.get_file(change.package, change.name, change.tier) is not None
+                self.update_file(change.package, change.name, change.tier, stored)
+
+        if self._pruned + self.CHANGE_LIFETIME < time():
+            self._pruned = time()
+            self.metadata.prune_changes(self._pruned - self.CHANGE_LIFETIME)
+
+    def start(self, evict=True):
+        """Start background task, ``evict`` is only given to one worker."""
+        self._sync = tornado.ioloop.PeriodicCallback(self.sync, self.SYNC_INTERVAL * 1000)
+        self._sync.start()
+
+        self.metrics.start()
+
+        self.evictor.start(evict)
+
+    def log_request(self, handler):
+        """Log request slower than ``server.slow_request`` millisecond(s) with the time of each phase."""
+        tornado.web.Application.log_request(self, handler)
+
+        threshold = self.settings['server']['slow_request']
+        duration = handler.request.request_time() * 1000
+        if not threshold or duration < threshold:
+            return
+
+        phases = OrderedDict((name, round(phase * 1000, 1)) for name, phase in getattr(handler, 'phases', {}).items())
+        app_log.warning('slow request %s %s %d in %.1f ms: %s', handler.request.method, handler.request.uri,
+                        handler.get_status(), duration,
+                        ' '.join('{}={}'.format(name, phase) for name, phase in phases.items()) or '-',
+                        extra={'phases': phases})
+
+    def add_package(self, package_name):
+        if self.packages.add(package_name):
+            self.pages.invalidate(SimpleHandler.PAGE_KEY)
+
+    def remove_package(self, package_name):
+        if self.packages.remove(package_name):
+            self.pages.invalidate(SimpleHandler.PAGE_KEY)
+
+    def get_metadata_path(self):
+        return pathlib.Path(self.settings['path']['base']) / self.settings['path']['metadata']
+
     def normalize_name(self, package_name):
         return package_name.replace('-', '_').lower()
 
@@ -235,8 +425,6 @@ def execute(args, cfg, daemon=None):
         # setup logging, on start it have to do here since all fd will close by daemonocle
         setup_logging(cfg)
 
-        application = Application(cfg, args.debug)
-
         if args.debug:
             args.level = logging.DEBUG
 
@@ -244,15 +432,62 @@ def execute(args, cfg, daemon=None):
         if args.level is not None:
             logging.root.setLevel(args.level)
 
-        # listen to port
+        # listen to port, socket is shared by every worker process
         port = cfg['server']['port']
         try:
-            application.listen(port)
+            sockets = tornado.netutil.bind_sockets(port)
             app_log.info('listening port %s', port)
         except OSError:
             app_log.error('unable to listen port %s', port)
             return
 
+        # database is migrated once before forking, each worker open its own connection after
+        metadata = get_metadata(cfg)
+        if metadata.created:
+            metadata.import_legacy(Path(cfg['path']['cache']), Path(cfg['path']['upload']))
+        metadata.close()
+
+        workers = getattr(args, 'workers', None)
+        if workers is None:
+            workers = cfg['server']['workers']
+        if workers != 1 and args.debug:
+            app_log.warning('debug mode run a single worker')
+            workers = 1
+
+        task_id = None
+        if workers != 1:
+            try:
+                # only return in the forked worker, 0 worker is one per CPU
+                task_id = tornado.process.fork_processes(workers)
+            except KeyboardInterrupt:
+                app_log.info('Keyboard interrupt')
+                return
+
+            # daemon stop only signal the parent process, worker leave once it is gone
+            parent = os.getppid()
+
+            def check_parent():
+                if os.getppid() != parent:
+                    app_log.info('parent process is gone')
+                    tornado.ioloop.IOLoop.instance().stop()
+
+            tornado.ioloop.PeriodicCallback(check_parent, 1000).start()
+
+        application = Application(cfg, args.debug)
+        application.start(evict=not task_id)
+
+        server = tornado.httpserver.HTTPServer(application)
+        server.add_sockets(sockets)
+
+        if daemon is None:
+            # prevent block for IO allowed ctrl-c to pass
+            # http://stackoverflow.com/a/9578595
+            def set_ping(timeout):
+                ioloop = tornado.ioloop.IOLoop.instance()
+                ioloop.add_timeout(timeout, lambda: set_ping(timeout))
+
+            set_ping(timedelta(seconds=0.5))
+
         # start main loop
         ioloop = tornado.ioloop.IOLoop.instance()
         try:
@@ -270,14 +505,6 @@ def execute(args, cfg, daemon=None):
 
     if args.cmd == 'start':
         if daemon is None:
-            # prevent block for IO allowed ctrl-c to pass
-            # http://stackoverflow.com/a/9578595
-            def set_ping(timeout):
-                ioloop = tornado.ioloop.IOLoop.instance()
-                ioloop.add_timeout(timeout, lambda: set_ping(timeout))
-
-            set_ping(timedelta(seconds=0.5))
-
             worker()
         else:
             daemon.worker = worker
@@ -298,30 +525,45 @@ def execute(args, cfg, daemon=None):
     return True
 
 
+def get_metadata(cfg):
+    return MetadataStore(Path(cfg['path']['base']) / cfg['path']['metadata'])
+
+
 def hash_pkg(args, cfg):
+    metadata = get_metadata(cfg)
     try:
-        for base in [Path(cfg['path']['cache']),
-                     Path(cfg['path']['upload'])]:
+        Calculator(metadata, cfg, args.jobs, args.force).run()
+    except FileNotFoundError as e:
+        _log.error(e)
+    finally:
+        metadata.close()
 
-            digest_base = []
-            for path in base.iterdir():
-                if not path.is_dir():
-                    continue
-                _log.info('scanning %s', path)
 
-                checksum = Checksum(path)
+def migrate(args, cfg):
+    metadata = get_metadata(cfg)
+    try:
+        metadata.import_legacy(Path(cfg['path']['cache']), Path(cfg['path']['upload']))
+    finally:
+        metadata.close()
 
-                digests = []
-                for md5, file in checksum.iter_dir():
-                    digests.append(checksum.format(md5, file.relative_to(path)))
-                    digest_base.append(checksum.format(md5, file.relative_to(base)))
 
-                checksum.write(digests)
+def eviction(args, cfg):
+    metadata = get_metadata(cfg)
+    try:
+        usage, files = select_evictions(metadata, cfg)
 
-            Checksum(base).write(digest_base, 'checksums.md5')
+        size = 0
+        for data in files:
+            accessed = data.accessed or data.created
+            print('{}/{}  {} byte(s)  {} hit(s)  last used {}'.format(
+                data.package, data.name, data.size, data.hits,
+                datetime.fromtimestamp(accessed).strftime('%Y-%m-%d %H:%M:%S')))
+            size += data.size or 0
 
-    except FileNotFoundError as e:
-        _log.error(e)
+        print('cache use {:.1f} of {} MiB, {} file(s) of {:.1f} MiB would be evicted'.format(
+            usage / 1024 / 1024, cfg['eviction']['size'] or 'unlimited', len(files), size / 1024 / 1024))
+    finally:
+        metadata.close()
 
 
 def main():
@@ -346,6 +588,7 @@ def main():
     # start and daemon related command
     cmd = subparsers.add_parser('start')
     cmd.add_argument('--debug', default=False, action='store_true')
+    cmd.add_argument('--workers', type=int, help='number of worker process, 0 for one per CPU')
     cmd.set_defaults(cmd='start')
 
     if daemonocle is not None:
@@ -369,8 +612,16 @@ def main():
     cmd.set_defaults(cmd='setup')
 
     cmd = subparsers.add_parser('calculate')
+    cmd.add_argument('--jobs', type=int, default=0, help='file(s) hashed at a time, 0 for one per CPU')
+    cmd.add_argument('--force', default=False, action='store_true', help='hash file(s) already up to date too')
     cmd.set_defaults(cmd='calculate')
 
+    cmd = subparsers.add_parser('migrate')
+    cmd.set_defaults(cmd='migrate')
+
+    cmd = subparsers.add_parser('eviction')
+    cmd.set_defaults(cmd='eviction')
+
     # parse
     args = parser.parse_args()
 
@@ -379,6 +630,7 @@ def main():
         args.cmd = 'start'
         args.foreground = False
         args.debug = False
+        args.workers = None
 
     # stop here if this ask for setup
     if args.cmd == 'setup':
@@ -412,6 +664,14 @@ def main():
         setup_logging(cfg)
         hash_pkg(args, cfg)
 
+    elif args.cmd == 'migrate':
+        setup_logging(cfg)
+        migrate(args, cfg)
+
+    elif args.cmd == 'eviction':
+        setup_logging(cfg)
+        eviction(args, cfg)
+
     elif not execute(args, cfg, daemon):
         parser.error('unable to create daemon')
 
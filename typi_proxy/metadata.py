@@ -0,0 +1,344 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import os
+import pickle
+import sqlite3
+from bisect import bisect_left
+from collections import namedtuple
+from time import time
+
+from tornado.log import app_log
+
+from .util import Checksum, PackageData
+
+
+UPSTREAM, CACHE, UPLOAD = 0, 1, 2
+
+FileData = namedtuple('FileData', ['package', 'name', 'tier', 'md5', 'size', 'mtime', 'link', 'created',
+                                   'accessed', 'hits', 'sha256'])
+Listing = namedtuple('Listing', ['package', 'status', 'fetched', 'updated', 'versions'])
+Change = namedtuple('Change', ['id', 'pid', 'package', 'name', 'tier'])
+
+
+class MetadataStore():
+    """Package metadata kept in a single SQLite database in WAL mode.
+
+    Hold digest, size and tier of every cached or uploaded file, and the upstream index of
+    each package with the time it was fetched. Every write is also appended to the ``change``
+    table, so other process sharing the database know what to reload.
+    """
+    MIGRATIONS = [
+        [
+            '''CREATE TABLE file (
+                package TEXT NOT NULL,
+                name TEXT NOT NULL,
+                tier INTEGER NOT NULL,
+                md5 TEXT,
+                size INTEGER,
+                mtime REAL,
+                link TEXT,
+                created REAL NOT NULL,
+                PRIMARY KEY (package, tier, name)
+            )''',
+            '''CREATE TABLE listing (
+                package TEXT NOT NULL PRIMARY KEY,
+                status INTEGER NOT NULL,
+                fetched REAL NOT NULL,
+                updated REAL
+            )''',
+            '''CREATE TABLE upstream (
+                package TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                md5 TEXT,
+                link TEXT,
+                PRIMARY KEY (package, position)
+            )''',
+        ],
+        [
+            'ALTER TABLE file ADD COLUMN accessed REAL',
+            'ALTER TABLE file ADD COLUMN hits INTEGER NOT NULL DEFAULT 0',
+        ],
+        [
+            '''CREATE TABLE change (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pid INTEGER NOT NULL,
+                package TEXT NOT NULL,
+                name TEXT,
+                tier INTEGER,
+                created REAL NOT NULL
+            )''',
+        ],
+        [
+            'ALTER TABLE file ADD COLUMN sha256 TEXT',
+            'ALTER TABLE upstream ADD COLUMN sha256 TEXT',
+        ],
+    ]
+
+    # order cached file are evicted in, by policy name
+    EVICTION_ORDER = {
+        'lru': 'COALESCE(accessed, created)',
+        'lfu': 'hits, COALESCE(accessed, created)',
+        'size': 'size DESC, COALESCE(accessed, created)',
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.connection = sqlite3.connect(str(path), timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        self.created = self.migrate() == 0
+
+    def migrate(self):
+        """Bring the schema up to date, return the version it was at."""
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        with self.connection:
+            for i, statements in enumerate(self.MIGRATIONS[version:], version + 1):
+                app_log.info('migrate metadata %s to version %d', self.path, i)
+                for statement in statements:
+                    self.connection.execute(statement)
+                self.connection.execute('PRAGMA user_version={:d}'.format(i))
+        return version
+
+    def close(self):
+        self.connection.close()
+
+    def add_file(self, package, name, tier, md5, size=None, mtime=None, link=None, sha256=None):
+        self.add_files([(package, name, tier, md5, size, mtime, link, sha256)])
+
+    def add_files(self, files, replace=True):
+        """Add list of ``(package, name, tier, md5, size, mtime, link, sha256)`` in one transaction.
+
+        File already recorded is left as it is unless ``replace``, return number of file(s) written.
+        """
+        statement = ('INSERT OR {} INTO file (package, name, tier, md5, size, mtime, link, sha256, created) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'.format('REPLACE' if replace else 'IGNORE'))
+
+        created = time()
+        with self.connection:
+            cursor = self.connection.executemany(statement, [tuple(file) + (created,) for file in files])
+            self.add_changes([(file[0], file[1], file[2]) for file in files], created)
+        return cursor.rowcount
+
+    def update_digests(self, digests):
+        """Update list of ``(package, name, tier, md5, size, mtime, sha256)`` of file(s) already recorded."""
+        with self.connection:
+            self.connection.executemany('UPDATE file SET md5 = ?, size = ?, mtime = ?, sha256 = ? '
+                                        'WHERE package = ? AND tier = ? AND name = ?',
+                                        [(md5, size, mtime, sha256, package, tier, name)
+                                         for package, name, tier, md5, size, mtime, sha256 in digests])
+            self.add_changes([(digest[0], digest[1], digest[2]) for digest in digests])
+
+    def remove_file(self, package, name, tier):
+        self.remove_files([(package, name, tier)])
+
+    def remove_files(self, files):
+        """Remove list of ``(package, name, tier)`` in one transaction."""
+        with self.connection:
+            self.connection.executemany('DELETE FROM file WHERE package = ? AND tier = ? AND name = ?',
+                                        [(package, tier, name) for package, name, tier in files])
+            self.add_changes(files)
+
+    def add_changes(self, changes, created=None):
+        """Record list of ``(package, name, tier)`` changed, name is ``None`` for the upstream index."""
+        if created is None:
+            created = time()
+
+        self.connection.executemany('INSERT INTO change (pid, package, name, tier, created) VALUES (?, ?, ?, ?, ?)',
+                                    [(self.pid,) + tuple(change) + (created,) for change in changes])
+
+    def changes(self, since):
+        """Return list of ``Change`` recorded after change id ``since``."""
+        rows = self.connection.execute('SELECT id, pid, package, name, tier FROM change WHERE id > ? ORDER BY id',
+                                       (since,))
+        return [Change(*row) for row in rows]
+
+    def last_change(self):
+        return self.connection.execute('SELECT COALESCE(MAX(id), 0) FROM change').fetchone()[0]
+
+    def prune_changes(self, before):
+        with self.connection:
+            self.connection.execute('DELETE FROM change WHERE created < ?', (before,))
+
+    def data_version(self):
+        """Number changing whenever another connection commit to the database."""
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def get_file(self, package, name, tier):
+        row = self.connection.execute('SELECT * FROM file WHERE package = ? AND tier = ? AND name = ?',
+                                      (package, tier, name)).fetchone()
+        if row is None:
+            return None
+        return FileData(*row)
+
+    def files(self, package, tier=None):
+        if tier is None:
+            rows = self.connection.execute('SELECT * FROM file WHERE package = ?', (package,))
+        else:
+            rows = self.connection.execute('SELECT * FROM file WHERE package = ? AND tier = ?', (package, tier))
+        return [FileData(*row) for row in rows]
+
+    def touch_files(self, accesses):
+        """Add list of ``(package, name, tier, accessed, hits)`` to the access record of each file."""
+        with self.connection:
+            self.connection.executemany('UPDATE file SET accessed = MAX(COALESCE(accessed, 0), ?), hits = hits + ? '
+                                        'WHERE package = ? AND tier = ? AND name = ?',
+                                        [(accessed, hits, package, tier, name)
+                                         for package, name, tier, accessed, hits in accesses])
+
+    def usage(self, tier):
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM file WHERE tier = ?', (tier,)).fetchone()[0]
+
+    def evictable(self, policy):
+        """Iterate cached file in the order ``policy`` evict them."""
+        try:
+            order = self.EVICTION_ORDER[policy]
+        except KeyError:
+            raise Exception('unknown eviction policy {}, use one of {}'.format(
+                policy, ', '.join(sorted(self.EVICTION_ORDER))))
+
+        rows = self.connection.execute('SELECT * FROM file WHERE tier = ? ORDER BY ' + order, (CACHE,))
+        return (FileData(*row) for row in rows)
+
+    def tier_files(self, tier):
+        rows = self.connection.execute('SELECT * FROM file WHERE tier = ? ORDER BY package, name', (tier,))
+        return [FileData(*row) for row in rows]
+
+    def locations(self):
+        """Return list of ``(package, name, tier)`` of every stored file."""
+        return self.connection.execute('SELECT package, name, tier FROM file').fetchall()
+
+    def packages(self):
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT package FROM file')]
+
+    def save_listing(self, package, status, versions=None, fetched=None, updated=None):
+        """Save result of fetching the upstream index of the package.
+
+        ``updated`` is the time versions were last fetched successfully, ``fetched`` unless given
+        for a successful fetch. Failed fetch keep the previous versions unless given.
+        """
+        if fetched is None:
+            fetched = time()
+
+        with self.connection:
+            if status == 200 or versions is not None:
+                if status != 200:
+                    updated = None
+                elif updated is None:
+                    updated = fetched
+                self.connection.execute('INSERT OR REPLACE INTO listing VALUES (?, ?, ?, ?)',
+                                        (package, status, fetched, updated))
+                self.connection.execute('DELETE FROM upstream WHERE package = ?', (package,))
+                self.connection.executemany('INSERT INTO upstream (package, position, name, md5, link, sha256) '
+                                            'VALUES (?, ?, ?, ?, ?, ?)',
+                                            [(package, i, data.name, data.md5, data.link, data.sha256)
+                                             for i, data in enumerate(versions or [])])
+            else:
+                self.connection.execute('INSERT OR IGNORE INTO listing VALUES (?, ?, ?, NULL)',
+                                        (package, status, fetched))
+                self.connection.execute('UPDATE listing SET status = ?, fetched = ? WHERE package = ?',
+                                        (status, fetched, package))
+
+            self.add_changes([(package, None, None)], fetched)
+
+    def has_listing(self, package):
+        return self.connection.execute('SELECT 1 FROM listing WHERE package = ?', (package,)).fetchone() is not None
+
+    def load_listing(self, package):
+        row = self.connection.execute('SELECT status, fetched, updated FROM listing WHERE package = ?',
+                                      (package,)).fetchone()
+        if row is None:
+            return None
+
+        rows = self.connection.execute('SELECT name, md5, link, sha256 FROM upstream WHERE package = ? '
+                                       'ORDER BY position', (package,))
+        return Listing(package, row[0], row[1], row[2],
+                       [PackageData(name, md5, link, UPSTREAM, sha256) for name, md5, link, sha256 in rows])
+
+    def import_legacy(self, cache_path, upload_path):
+        """Import ``.md5`` files and ``.cache`` pickles of the previous version.
+
+        File and index already recorded are kept, what is in the database is newer than the legacy
+        file(s), so it is safe to import again.
+        """
+        files = listings = 0
+
+        for tier, base in [(CACHE, cache_path), (UPLOAD, upload_path)]:
+            if not base.exists():
+                continue
+
+            for path in base.iterdir():
+                if not path.is_dir():
+                    continue
+
+                digests = []
+                for md5, name in Checksum(path).iter():
+                    file = path / name
+                    if not file.is_file():
+                        continue
+
+                    stat = file.stat()
+                    digests.append((path.name, name, tier, md5, stat.st_size, stat.st_mtime, None, None))
+
+                files += self.add_files(digests, replace=False)
+
+                cache_file = path / '.cache'
+                if tier != CACHE or not cache_file.exists() or self.has_listing(path.name):
+                    continue
+
+                try:
+                    with cache_file.open('rb') as f:
+                        versions = pickle.load(f)
+                except Exception as e:
+                    app_log.warning('unable to load %s: %s', cache_file, e)
+                    continue
+
+                self.save_listing(path.name, 200, [PackageData(*data) for data in versions],
+                                  cache_file.stat().st_mtime)
+                listings += 1
+
+        app_log.info('imported %d file(s) and %d index(es)', files, listings)
+        return files, listings
+
+
+class PackageIndex():
+    """Name of every uploaded or cached package, sorted case insensitively."""
+
+    def __init__(self, names=()):
+        self.keys = []
+        self.names = set()
+        for name in names:
+            self.add(name)
+
+    def __iter__(self):
+        return (name for _, name in self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def remove(self, name):
+        if name not in self.names:
+            return False
+
+        key = (name.lower(), name)
+        del self.keys[bisect_left(self.keys, key)]
+        self.names.remove(name)
+        return True
+
+    def add(self, name):
+        """Add package name, return ``False`` if it is already known."""
+        if name in self.names:
+            return False
+
+        key = (name.lower(), name)
+        self.keys.insert(bisect_left(self.keys, key), key)
+        self.names.add(name)
+        return True
@@ -0,0 +1,182 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+from bisect import bisect_left
+
+import tornado.ioloop
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return str(value)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+
+    labels = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        labels.append('{}="{}"'.format(name, value))
+    return '{' + ','.join(labels) + '}'
+
+
+class Metric():
+    """Base of every metric, value are kept by tuple of label values and only formatted on scrape."""
+    TYPE = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, self.labels, labels, value
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.TYPE)]
+        for name, label_names, labels, value in self.samples():
+            lines.append('{}{} {}'.format(name, format_labels(label_names, labels), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    TYPE = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    # second(s)
+    BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        Metric.__init__(self, name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            # count of each bucket, not cumulated, and sum of observed value
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0]
+
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self):
+        label_names = self.labels + ('le',)
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulated = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulated += count
+                yield self.name + '_bucket', label_names, labels + (format_value(bound),), cumulated
+            yield self.name + '_sum', self.labels, labels, total
+            yield self.name + '_count', self.labels, labels, cumulated
+
+
+class Metrics():
+    """Activity of the proxy, given in Prometheus text format on ``/metrics``.
+
+    Updating a metric is a dictionary update, cheap enough for the per chunk path of transload
+    and upload, text is only built on scrape. Each worker count its own activity.
+    """
+    # second(s) between event loop lag measure
+    LAG_INTERVAL = 0.5
+
+    def __init__(self):
+        self.metrics = []
+
+        self.index_requests = self.add(Counter(
+            'typi_index_requests_total',
+            'Package index request by source: rendered page cache, stored index (cache) or upstream crawl (miss).',
+            ['source']))
+        self.downloads = self.add(Counter(
+            'typi_downloads_total',
+            'Package file request by source: upload, cache or transload (miss).',
+            ['source']))
+
+        self.transload_bytes = self.add(Counter(
+            'typi_transload_bytes_total',
+            'Byte(s) received from upstream by transload.'))
+        self.transload_duration = self.add(Histogram(
+            'typi_transload_duration_seconds',
+            'Duration of transload, retry included, by result.',
+            ['result'], buckets=(.1, .5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)))
+
+        self.upstream_responses = self.add(Counter(
+            'typi_upstream_responses_total',
+            'Response from upstream by status code, 599 for connection error and timeout.',
+            ['code']))
+        self.upstream_duration = self.add(Histogram(
+            'typi_upstream_request_seconds',
+            'Duration of request to upstream, queue time excluded.'))
+        self.upstream_queue = self.add(Histogram(
+            'typi_upstream_queue_seconds',
+            'Time request to upstream wait for a free connection.'))
+
+        self.upload_bytes = self.add(Counter(
+            'typi_upload_bytes_total',
+            'Byte(s) of package file uploaded.'))
+        self.upload_duration = self.add(Histogram(
+            'typi_upload_duration_seconds',
+            'Duration of upload request.',
+            buckets=(.1, .5, 1, 2.5, 5, 10, 30, 60, 300)))
+
+        self.active_streams = self.add(Gauge(
+            'typi_active_streams',
+            'Response or request body being streamed by kind: file, transload or upload.',
+            ['kind']))
+
+        self.loop_lag = self.add(Histogram(
+            'typi_event_loop_lag_seconds',
+            'Delay of timer callback on the event loop.',
+            buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 5)))
+
+        self._expected = None
+        self._timeout = None
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return ''.join(metric.render() for metric in self.metrics)
+
+    def start(self):
+        """Start measuring event loop lag."""
+        self._expected = None
+        self.check_lag()
+
+    def stop(self):
+        if self._timeout is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self._timeout)
+            self._timeout = None
+
+    def check_lag(self):
+        ioloop = tornado.ioloop.IOLoop.current()
+        now = ioloop.time()
+        if self._expected is not None:
+            self.loop_lag.observe(max(now - self._expected, 0))
+
+        self._expected = now + self.LAG_INTERVAL
+        self._timeout = ioloop.call_at(self._expected, self.check_lag)
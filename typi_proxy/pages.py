@@ -0,0 +1,133 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import hashlib
+import zlib
+from collections import namedtuple, OrderedDict
+from time import time
+
+from tornado.log import app_log
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+Page = namedtuple('Page', ['body', 'etag', 'expire', 'encodings'])
+
+
+def compress_gzip(body):
+    # wbits 31 write the gzip header without timestamp, so the same page give the same bytes
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def compress_brotli(body):
+    return brotli.compress(body)
+
+
+COMPRESSORS = {
+    'gzip': compress_gzip,
+    'br': compress_brotli,
+}
+
+
+def select_encoding(accept_encoding, encodings):
+    """Return the content coding in ``encodings`` preferred by ``Accept-Encoding``, ``None`` for identity."""
+    best, best_q = None, 0
+    accepted = {}
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        name = name.strip().lower()
+
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0
+        accepted[name] = q
+
+    # encodings is ordered by preference, first one win when q is the same
+    for name in encodings:
+        q = accepted.get(name, accepted.get('*', 0))
+        if q > best_q:
+            best, best_q = name, q
+
+    if best is not None and best_q < accepted.get('identity', 0):
+        return None
+    return best
+
+
+class PageCache():
+    """Rendered index page by package and format, kept until invalidated or expired.
+
+    Only ``size`` package(s) are kept, the least recently used one is dropped first. Page of at
+    least ``MIN_SIZE`` byte(s) is compressed once with each of ``encodings`` when it is stored.
+    """
+    MIN_SIZE = 1024
+
+    def __init__(self, size, encodings=()):
+        self.size = size
+        self.pages = OrderedDict()
+        self.versions = {}
+
+        self.encodings = []
+        for name in encodings:
+            if name not in COMPRESSORS:
+                raise Exception('unknown encoding {}, use one of {}'.format(name, ', '.join(sorted(COMPRESSORS))))
+            if name == 'br' and brotli is None:
+                app_log.warning('brotli is not installed, br encoding is disabled')
+                continue
+            self.encodings.append(name)
+
+    def version(self, key):
+        """Version to give back to ``put``, page rendered before an invalidation is not stored."""
+        return self.versions.get(key, 0)
+
+    def get(self, key, fmt):
+        pages = self.pages.get(key)
+        if pages is None:
+            return None
+
+        page = pages.get(fmt)
+        if page is None:
+            return None
+
+        if page.expire is not None and page.expire < time():
+            del pages[fmt]
+            return None
+
+        self.pages.move_to_end(key)
+        return page
+
+    def put(self, key, fmt, version, body, expire=None):
+        if version != self.version(key):
+            return None
+
+        digest = hashlib.sha1(body).hexdigest()
+
+        encodings = OrderedDict()
+        if len(body) >= self.MIN_SIZE:
+            for name in self.encodings:
+                compressed = COMPRESSORS[name](body)
+                if len(compressed) < len(body):
+                    encodings[name] = (compressed, '"{}-{}"'.format(digest, name))
+
+        page = Page(body, '"{}"'.format(digest), expire, encodings)
+        self.pages.setdefault(key, {})[fmt] = page
+        self.pages.move_to_end(key)
+
+        while len(self.pages) > self.size:
+            self.pages.popitem(last=False)
+
+        return page
+
+    def invalidate(self, key):
+        self.versions[key] = self.version(key) + 1
+        self.pages.pop(key, None)
@@ -11,21 +11,40 @@ from tornado.web import stream_request_body, RequestHandler, HTTPError
 
 @stream_request_body
 class StreamingFormDataHandler(RequestHandler):
+    """Parse a ``multipart/form-data`` body as it is received.
+
+    Each disposition call ``on_<name>_begin(data)`` with its first data, ``on_<name>_data(data)``
+    with the following and ``on_<name>_end()``, value of disposition without ``on_<name>_data``
+    is also kept in ``_disp_buffer``. Data is given as slice of the received chunk, only the
+    few byte(s) that may be the start of a boundary are kept between chunks.
+
+    Line ending may be either CRLF or a bare LF, as sent by old distutils. It is told by the first
+    boundary line, a CR ending the data of a disposition is only part of the line ending with CRLF.
+    """
     HANDLE_PREFIX = 'on'
     HANDLE_BEGIN_SUFFIX = 'begin'
     HANDLE_DATA_SUFFIX = 'data'
     HANDLE_END_SUFFIX = 'end'
 
+    # parser state
+    PREAMBLE, BOUNDARY, HEADER, BODY, EPILOGUE = range(5)
+
+    # byte(s) of disposition header, or boundary line, kept waiting for its end
+    MAX_HEADER_SIZE = 16 * 1024
+
     def prepare(self):
-        self._boundary = None
-        self._boundary_length = None
-        self._boundary_padding = 2
-        self._sep = b'\r\n\r\n'
+        self._delimiter = None
+        self._crlf = None
+        self._state = self.PREAMBLE
+        self._buffer = bytearray()
+        self._header_lines = []
+        self._header_size = 0
         self._disp_header = None
         self._disp_params = None
         self._disp_name = None
         self._disp_buffer = None
-        self._buffer = None
+        self._disp_buffered = False
+        self._disp_begun = False
 
         content_type = self.request.headers.get('content-type', '')
         if not content_type.startswith('multipart/form-data'):
@@ -37,14 +56,16 @@ class StreamingFormDataHandler(RequestHandler):
             if k == 'boundary' and v:
                 if v.startswith('"') and v.endswith('"'):
                     v = v[1:-1]
-                self._boundary = b'--' + utf8(v)
-                self._boundary_length = len(self._boundary) + self._boundary_padding
+                self._delimiter = b'\n--' + utf8(v)
                 break
 
-        if self._boundary is None:
+        if self._delimiter is None:
             raise HTTPError(400)
 
-        app_log.debug('boundary: %s', self._boundary)
+        # boundary may start the body without line ending before it
+        self._buffer += b'\r\n'
+
+        app_log.debug('boundary: %s', self._delimiter[3:])
 
     def execute_handle(self, suffix, *args, **kwargs):
         if self._disp_name is None:
@@ -57,76 +78,148 @@ class StreamingFormDataHandler(RequestHandler):
         return False
 
     def data_received(self, data):
-        if self._buffer is not None:
-            data = self._buffer + data
-            self._buffer = None
-
-        boundary = data.find(self._boundary)
-        if boundary != 0 and self._disp_buffer is None:
-            self._boundary_length += boundary - self._boundary_padding
-            self._boundary_padding = boundary
-            self._sep = b''.join([data[:boundary], data[:boundary]])
-        elif boundary != 0:
-            # boundary not at the begining
-            value = data if boundary == -1 else data[:boundary - self._boundary_padding]
-            if not self.execute_handle(self.HANDLE_DATA_SUFFIX, value):
-                self._disp_buffer += value
-
-            if boundary == -1:
-                # boundary not found, streaming in progress
-                return
-            # boundary found, terminate current disposition
-            self.execute_handle(self.HANDLE_END_SUFFIX)
-
-        # process all disposition found in current stream
-        while boundary != -1:
-            app_log.debug('processing boundary')
-            data = data[boundary:]
-
-            # find next boundary
-            boundary = data.find(self._boundary, self._boundary_length)
-
-            eoh = data.find(self._sep)
-            if eoh == -1:
-                if boundary == -1:
-                    # header and boundary not found, stream probably cut in the midle of header
-                    self._buffer = data
-                    break
-                # disposition not found because header not found
-                app_log.debug('invalid disposition header')
-                continue
-
-            # process header
-            data_header = data[self._boundary_length:eoh]
-
-            app_log.debug('header data: %r', data_header)
-            self._disp_header = HTTPHeaders.parse(data_header.decode('utf-8'))
-            disp_header = self._disp_header.get('Content-Disposition', '')
-
-            disposition, self._disp_params = _parse_header(disp_header)
-            if disposition != 'form-data':
-                app_log.warning('invalid multipart/form-data')
-                continue
-
-            self._disp_name = self._disp_params.get('name')
-            if self._disp_name is None:
-                app_log.warning('multipart/form-data value missing name')
-                continue
-            app_log.debug('disposition name %s', self._disp_name)
-
-            # get disposition value and execute begin handler
-            bod = eoh + len(self._sep)
-            eod = boundary - self._boundary_padding
-            if boundary == -1:
-                value = data[bod:]
+        if not isinstance(data, bytes):
+            data = bytes(data)
+
+        offset = 0
+        while self._buffer and offset < len(data):
+            # left over of previous chunk, only copy as much of data as needed to go on with it
+            size = len(self._buffer)
+            end = offset + max(size, len(self._delimiter) + 2)
+            self._buffer += data[offset:end]
+            offset = min(end, len(data))
+
+            consumed = self.parse(self._buffer)
+            if consumed >= size:
+                # what is left come from data, go on from there without copy
+                offset -= len(self._buffer) - consumed
+                self._buffer.clear()
+            else:
+                del self._buffer[:consumed]
+                if len(self._buffer) > self.MAX_HEADER_SIZE:
+                    app_log.warning('multipart/form-data header too long')
+                    raise HTTPError(400)
+
+        if offset < len(data):
+            consumed = self.parse(data, offset)
+            self._buffer += data[consumed:]
+
+    def parse(self, buffer, pos=0):
+        """Parse ``buffer`` from ``pos``, return where parsing stop for lack of data."""
+        end = len(buffer)
+        delimiter = self._delimiter
+
+        while pos < end:
+            if self._state in (self.PREAMBLE, self.BODY):
+                found = buffer.find(delimiter, pos)
+                if found == -1:
+                    # keep what may be the start of the delimiter, and the CR before it
+                    keep = buffer.find(b'\n', max(end - len(delimiter) + 1, pos))
+                    while keep != -1 and not delimiter.startswith(buffer[keep:end]):
+                        keep = buffer.find(b'\n', keep + 1)
+                    if keep == -1:
+                        keep = end
+                    if self._crlf and keep > pos and buffer[keep - 1] == 13:
+                        keep -= 1
+
+                    self.emit(buffer, pos, keep)
+                    return keep
+
+                data_end = found - 1 if self._crlf and found > pos and buffer[found - 1] == 13 else found
+                self.emit(buffer, pos, data_end)
+                if self._state == self.BODY:
+                    self.end_disposition()
+
+                self._state = self.BOUNDARY
+                pos = found + len(delimiter)
+
+            elif self._state == self.BOUNDARY:
+                if buffer[pos:pos + 2] == b'--':
+                    # close delimiter
+                    self._state = self.EPILOGUE
+                    continue
+
+                eol = buffer.find(b'\n', pos)
+                if eol == -1:
+                    return pos
+
+                if self._crlf is None:
+                    self._crlf = eol > pos and buffer[eol - 1] == 13
+
+                # rest of the boundary line is only padding
+                self._state = self.HEADER
+                pos = eol + 1
+
+            elif self._state == self.HEADER:
+                eol = buffer.find(b'\n', pos)
+                if eol == -1:
+                    return pos
+
+                line = bytes(buffer[pos:eol]).rstrip(b'\r')
+                pos = eol + 1
+                if line:
+                    self._header_size += len(line)
+                    if self._header_size > self.MAX_HEADER_SIZE:
+                        app_log.warning('multipart/form-data header too long')
+                        raise HTTPError(400)
+                    self._header_lines.append(line)
+                    continue
+
+                self.begin_disposition()
+                self._state = self.BODY
+
             else:
-                value = data[bod:eod]
-            self._disp_buffer = value
+                return end
+
+        return pos
+
+    def begin_disposition(self):
+        lines, self._header_lines, self._header_size = self._header_lines, [], 0
+
+        self._disp_header = HTTPHeaders.parse(b'\r\n'.join(lines).decode('utf-8'))
+        disposition, self._disp_params = _parse_header(self._disp_header.get('Content-Disposition', ''))
+
+        self._disp_name = None
+        self._disp_buffer = bytearray()
+        self._disp_begun = False
+        if disposition != 'form-data':
+            app_log.warning('invalid multipart/form-data')
+            return
+
+        self._disp_name = self._disp_params.get('name')
+        if self._disp_name is None:
+            app_log.warning('multipart/form-data value missing name')
+            return
+        app_log.debug('disposition name %s', self._disp_name)
+
+        # value is only kept when it isn't streamed to a handler
+        self._disp_buffered = not hasattr(self, '_'.join([self.HANDLE_PREFIX, self._disp_name,
+                                                          self.HANDLE_DATA_SUFFIX]))
+
+    def emit(self, buffer, start, end):
+        """Give ``buffer[start:end]`` to the current disposition."""
+        if self._state != self.BODY or self._disp_name is None or (start == end and self._disp_begun):
+            return
+
+        if isinstance(buffer, bytes):
+            value = memoryview(buffer)[start:end]
+        else:
+            # left over buffer is reused, handler may keep what it is given
+            value = bytes(buffer[start:end])
+
+        if self._disp_buffered:
+            self._disp_buffer += value
+
+        if not self._disp_begun:
+            self._disp_begun = True
             self.execute_handle(self.HANDLE_BEGIN_SUFFIX, value)
+        else:
+            self.execute_handle(self.HANDLE_DATA_SUFFIX, value)
 
-            if boundary != -1:
-                # next boundary found, execute end handler
-                self.execute_handle(self.HANDLE_END_SUFFIX)
+    def end_disposition(self):
+        self.emit(b'', 0, 0)
+        self.execute_handle(self.HANDLE_END_SUFFIX)
+        self._disp_name = None
 
     def post(self):
         return
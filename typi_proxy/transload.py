@@ -0,0 +1,298 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import os
+from time import time
+from urllib.parse import urlsplit, parse_qs
+
+import tornado.gen
+import tornado.ioloop
+from tornado.httpclient import HTTPRequest
+from tornado.log import app_log
+
+from .metadata import CACHE
+from .util import Checksum, FileDigest
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class Transload():
+    """Single upstream download of a package file shared by every client asking for it.
+
+    Data is written to a ``.part`` file next to the cache file by a ``StreamWriter`` as it arrives
+    at upstream pace, no faster than the disk keep up with, the attached listeners are notified
+    once it is on disk and read it back at their own pace.
+    The part file is renamed to the cache file once its digest is verified, and an
+    interrupted download is continued with a ``Range`` request.
+    """
+    PART_SUFFIX = '.part'
+
+    def __init__(self, application, path, link):
+        self.application = application
+        self.path = path
+        self.file = application.get_cache_path() / path
+        self.part = self.file.with_name(self.file.name + self.PART_SUFFIX)
+        self.link = link
+        self.cfg = application.settings['transload']
+
+        self.code = None
+        self.headers = None
+        self.total = None
+        self.size = 0
+        self.done = False
+        self.error = None
+        self.listeners = []
+
+        self._headers = None
+        self._retry = 0
+        self._skip = False
+        self._file_digest = None
+        self._fd = None
+        self._writer = None
+        self._started = None
+
+        # digest advertised by upstream in the link fragment
+        self.digest_name, self.digest = None, None
+        fragment = parse_qs(urlsplit(link).fragment)
+        for name in ['sha256', 'md5']:
+            if name in fragment:
+                self.digest_name, self.digest = name, fragment[name][0]
+                break
+
+    def start(self):
+        try:
+            self.file.parent.mkdir()
+        except FileExistsError:
+            pass
+
+        self.application.transloads[self.path] = self
+        self._started = time()
+
+        self._fd = self.open_part()
+        if self._fd is None:
+            # another worker transload the same file, download it aside, first one done publish it
+            fd, self.part = self.application.create_part(self.file)
+            self._fd = os.fdopen(fd, 'wb', buffering=0)
+            app_log.info('%s is locked, transload to %s', self.file, self.part)
+
+        self._writer = self.application.stream_writer(self._fd, on_written=self.on_written)
+
+        # continue previous interrupted transload, digest have to be rebuild from what is on disk
+        self.reset(os.fstat(self._fd.fileno()).st_size)
+        if self.size:
+            app_log.info('resume %s from %d byte(s)', self.part, self.size)
+
+        self.fetch()
+
+    def open_part(self):
+        """Open the part file locked for this process, ``None`` if another process hold it."""
+        fd = self.part.open('ab', buffering=0)
+        if fcntl is None:
+            return fd
+
+        try:
+            fcntl.flock(fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            # part may have been published by the process releasing it meanwhile
+            if os.fstat(fd.fileno()).st_ino == os.stat(str(self.part)).st_ino:
+                return fd
+        except (BlockingIOError, FileNotFoundError):
+            pass
+
+        fd.close()
+        return None
+
+    def reset(self, size=0):
+        """Start over from the first ``size`` byte(s) of the part, done by the writer before the next write."""
+        self._file_digest = FileDigest()
+        self._writer.digests = [self._file_digest]
+
+        if size:
+            self._writer.call(self.rehash, self._writer.digests)
+        else:
+            self._writer.call(self.truncate, self._fd)
+        self.size = size
+
+    def rehash(self, digests):
+        with self.part.open('rb') as f:
+            chunk = f.read(Checksum.CHUNK_SIZE)
+            while chunk:
+                for digest in digests:
+                    digest.update(chunk)
+                chunk = f.read(Checksum.CHUNK_SIZE)
+
+    def truncate(self, fd):
+        fd.seek(0)
+        fd.truncate()
+
+    def hexdigest(self):
+        if self.digest_name == 'sha256':
+            return self._file_digest.sha256
+        return self._file_digest.md5
+
+    def fetch(self):
+        headers = {}
+        if self.size:
+            headers['Range'] = 'bytes={}-'.format(self.size)
+
+        app_log.debug('fetch %s %s', self.link, headers)
+
+        self._headers = None
+        self._skip = False
+
+        request = HTTPRequest(self.link,
+                              headers=headers,
+                              request_timeout=self.cfg['timeout'],
+                              header_callback=self.process_header,
+                              streaming_callback=self.process_body)
+
+        self.application.upstream.fetch(request, callback=self.process_finish)
+
+    def attach(self, listener):
+        self.listeners.append(listener)
+        if self.headers is not None:
+            listener.on_transload_header(self)
+
+    def detach(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def process_header(self, line):
+        header = line.strip()
+        if header.startswith('HTTP/'):
+            # status line, redirect response will send another set of header
+            self.code = int(header.split(' ', 2)[1])
+            self._headers = {}
+            return
+
+        if header:
+            if ':' not in header:
+                return
+
+            key, val = [x.strip() for x in header.split(':', 1)]
+            self._headers[key.lower()] = val
+            return
+
+        if self.code not in (200, 206):
+            return
+
+        if self.code == 206:
+            # Content-Range: bytes <start>-<end>/<total>
+            unit, _, content_range = self._headers.get('content-range', '').partition(' ')
+            byte_range, _, total = content_range.partition('/')
+            start = byte_range.partition('-')[0]
+            if unit != 'bytes' or not start.isdigit() or int(start) != self.size:
+                app_log.warning('unexpected range %r for %s', self._headers.get('content-range'), self.link)
+                self._skip = True
+                return
+        else:
+            total = self._headers.get('content-length')
+            if self.size:
+                app_log.info('range not supported for %s, restart transload', self.link)
+                self.reset()
+
+        if total and total.isdigit():
+            self.total = int(total)
+
+        if self.headers is None:
+            self.headers = []
+            if self.total is not None:
+                self.headers.append(('Content-Length', str(self.total)))
+            if 'content-type' in self._headers:
+                self.headers.append(('Content-Type', self._headers['content-type']))
+
+            for listener in list(self.listeners):
+                listener.on_transload_header(self)
+
+    def process_body(self, chunk):
+        if self._headers is None or self.code not in (200, 206) or self._skip:
+            return
+
+        self.application.metrics.transload_bytes.inc(amount=len(chunk))
+
+        # upstream is read further once the writer catch up
+        return self._writer.write(chunk)
+
+    def on_written(self, size):
+        self.size += size
+        for listener in list(self.listeners):
+            listener.on_transload_data(self)
+
+    def process_finish(self, response):
+        # size and digest are only known once everything received is written
+        tornado.ioloop.IOLoop.current().add_future(self._writer.drain(), lambda future: self.finalize(response))
+
+    @tornado.gen.coroutine
+    def finalize(self, response):
+        if self._writer.error is not None:
+            app_log.warning('Error while writing %s: %s', self.part, self._writer.error)
+            self.error = self._writer.error
+
+        elif response.error or self._skip:
+            app_log.warning('Error while transloading %s '
+                            'Errors details: (%s: %s)', self.link, response.code, response.reason)
+
+            if self._skip or (response.code == 416 and self.size):
+                # part on disk doesn't match with upstream, start over
+                self.reset()
+                if response.code == 416:
+                    self.fetch()
+                    return
+
+            # retry only when upstream already start sending the file
+            if self.headers is not None and self._retry < self.cfg['retry']:
+                self._retry += 1
+                app_log.info('retry %s (%d) from %d byte(s)', self.link, self._retry, self.size)
+                self.fetch()
+                return
+
+            self.error = response.error or Exception('unexpected response {}'.format(response.code))
+
+        elif self.total is not None and self.size != self.total:
+            app_log.warning('size mismatch for %s: %d of %d byte(s)', self.link, self.size, self.total)
+            self.error = Exception('size mismatch')
+
+        elif self.digest is not None and self.hexdigest() != self.digest:
+            app_log.warning('%s mismatch for %s: %s != %s', self.digest_name, self.link, self.hexdigest(),
+                            self.digest)
+            self.error = Exception('{} mismatch'.format(self.digest_name))
+
+            # content is corrupt, don't continue from it
+            self.reset()
+
+        if self.error is None:
+            try:
+                yield self._writer.commit()
+            except Exception as e:
+                self.error = e
+
+        # part is published or dropped while still locked, process waiting for it find it gone
+        if self.error is None:
+            app_log.debug('%s done', self.file)
+            self.part.replace(self.file)
+            self._writer.published(self.file)
+        elif (not self.size or self.part.name != self.file.name + self.PART_SUFFIX) and self.part.exists():
+            # nothing to resume from, or a private part no one will resume
+            self.part.unlink()
+
+        self._writer.close()
+        self._writer = None
+        self._fd = None
+
+        if self.error is None:
+            self.application.add_file(self.file.parent.name, self.file, CACHE, self._file_digest, self.link)
+
+        self.done = True
+        del self.application.transloads[self.path]
+
+        self.application.metrics.transload_duration.observe(time() - self._started,
+                                                            'ok' if self.error is None else 'error')
+
+        for listener in list(self.listeners):
+            listener.on_transload_finish(self)
+        self.listeners = []
@@ -0,0 +1,179 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+from collections import Counter, deque
+from functools import partial
+from time import time
+from urllib.parse import urlsplit
+
+import tornado
+import tornado.ioloop
+from tornado.httpclient import HTTPRequest
+from tornado.log import app_log
+from tornado.simple_httpclient import SimpleAsyncHTTPClient
+
+try:
+    from tornado.curl_httpclient import CurlAsyncHTTPClient
+except ImportError:
+    CurlAsyncHTTPClient = None
+
+try:
+    from tornado.simple_httpclient import _HTTPConnection
+except ImportError:
+    _HTTPConnection = None
+
+# pausing client extend internals of the simple client, found from tornado 4.3 up to 6.4 at least
+if (_HTTPConnection is not None and hasattr(_HTTPConnection, '_should_follow_redirect') and
+        hasattr(SimpleAsyncHTTPClient, '_connection_class')):
+
+    class PausingHTTPConnection(_HTTPConnection):
+        """Read the response body no further while the future returned by ``streaming_callback`` is pending."""
+
+        def data_received(self, chunk):
+            if self.request.streaming_callback is None or self._should_follow_redirect():
+                return _HTTPConnection.data_received(self, chunk)
+            return self.request.streaming_callback(chunk)
+
+    class PausingHTTPClient(SimpleAsyncHTTPClient):
+        def _connection_class(self):
+            return PausingHTTPConnection
+
+else:
+    PausingHTTPClient = None
+
+
+class UpstreamClient():
+    """HTTP client shared by every request made to upstream, index crawl and transload alike.
+
+    At most ``upstream.pool`` request run at a time, ``upstream.per_host`` of them to the same
+    host, other wait in arrival order. Time spent waiting is logged with each response and kept
+    on it as ``queue_time``.
+
+    Connection are only kept alive with the ``curl`` client, the ``simple`` one open a new
+    connection for every request. ``auto`` use ``curl`` when pycurl is installed.
+
+    Response is read no further while the future returned by the ``streaming_callback`` of its
+    request is pending, with both client unless the ``simple`` one of the installed tornado
+    doesn't allow it.
+    """
+
+    def __init__(self, cfg, metrics):
+        self.cfg = cfg
+        self.metrics = metrics
+
+        client_class = PausingHTTPClient or SimpleAsyncHTTPClient
+        if cfg['client'] == 'curl':
+            if CurlAsyncHTTPClient is None:
+                app_log.warning('pycurl is not installed, use simple upstream client')
+            else:
+                client_class = CurlAsyncHTTPClient
+        elif cfg['client'] == 'auto':
+            if CurlAsyncHTTPClient is not None:
+                client_class = CurlAsyncHTTPClient
+        elif cfg['client'] != 'simple':
+            raise Exception('unknown upstream client {}, use one of auto, curl, simple'.format(cfg['client']))
+
+        self.client = client_class(force_instance=True, max_clients=cfg['pool'])
+        self.curl = client_class is CurlAsyncHTTPClient
+        if not self.curl and cfg['keep_alive']:
+            app_log.info('simple upstream client open a connection for every request, install pycurl to keep '
+                         'them alive')
+        if not self.curl and PausingHTTPClient is None:
+            app_log.warning('simple upstream client of tornado %s read response as fast as upstream send it, '
+                            'install pycurl or a later tornado so transload is read no faster than it is written',
+                            tornado.version)
+
+        self.active = 0
+        self.hosts = Counter()
+        self.queue = deque()
+
+        # transfer each curl handle run, handle is reused once its request is done
+        self.transfers = {}
+
+    def fetch(self, request, callback):
+        """Fetch ``request`` once a connection is free, ``callback`` receive the response."""
+        if not isinstance(request, HTTPRequest):
+            request = HTTPRequest(request, request_timeout=self.cfg['read_timeout'])
+
+        if request.connect_timeout is None:
+            request.connect_timeout = self.cfg['connect_timeout']
+
+        if self.curl:
+            streaming, transfer = request.streaming_callback, []
+            if streaming is not None:
+                request.streaming_callback = partial(self.stream_curl, streaming, transfer)
+            request.prepare_curl_callback = partial(self.prepare_curl, streaming is not None, transfer)
+
+        self.queue.append((request, callback, urlsplit(request.url).netloc, time()))
+        self.dispatch()
+
+    def prepare_curl(self, streaming, transfer, curl):
+        import pycurl
+
+        transfer.append(curl)
+        self.transfers[curl] = transfer
+
+        if not self.cfg['keep_alive']:
+            curl.setopt(pycurl.FORBID_REUSE, 1)
+
+        if streaming:
+            # transload may last long, only give up once upstream stop sending
+            curl.setopt(pycurl.LOW_SPEED_LIMIT, 1)
+            curl.setopt(pycurl.LOW_SPEED_TIME, self.cfg['read_timeout'])
+
+    def stream_curl(self, streaming_callback, transfer, chunk):
+        import pycurl
+
+        future = streaming_callback(chunk)
+        if future is None or not transfer:
+            return
+
+        # curl give chunk through the IO loop, its handle may run another request by now
+        curl = transfer[0]
+        if self.transfers.get(curl) is not transfer:
+            return
+
+        curl.pause(pycurl.PAUSE_RECV)
+        tornado.ioloop.IOLoop.current().add_future(future, lambda f: self.resume_curl(curl, transfer))
+
+    def resume_curl(self, curl, transfer):
+        import pycurl
+
+        if self.transfers.get(curl) is transfer:
+            curl.pause(pycurl.PAUSE_CONT)
+
+    def dispatch(self):
+        for item in list(self.queue):
+            if self.active >= self.cfg['pool']:
+                break
+
+            request, callback, host, queued = item
+            if self.hosts[host] >= self.cfg['per_host']:
+                continue
+
+            self.queue.remove(item)
+            self.active += 1
+            self.hosts[host] += 1
+
+            self.client.fetch(request, callback=partial(self.process_response, host, time() - queued, callback))
+
+    def process_response(self, host, queue_time, callback, response):
+        self.active -= 1
+        self.hosts[host] -= 1
+
+        response.queue_time = queue_time
+        self.metrics.upstream_responses.inc(str(response.code))
+        self.metrics.upstream_queue.observe(queue_time)
+        if response.request_time is not None:
+            self.metrics.upstream_duration.observe(response.request_time)
+
+        app_log.debug('upstream %s %s in %.1f ms, queued %.1f ms', response.code, response.effective_url,
+                      (response.request_time or 0) * 1000, queue_time * 1000)
+
+        self.dispatch()
+        callback(response)
+
+    def close(self):
+        self.client.close()
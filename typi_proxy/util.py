@@ -5,13 +5,17 @@ Created on Aug 15, 2014
 """
 import hashlib
 from distutils.version import LooseVersion
-from collections import OrderedDict
+from collections import namedtuple, OrderedDict
 
 import yaml
 
 from . import yaml_anydict
 
 
+PackageData = namedtuple('PackageData', ['name', 'md5', 'link', 'cache', 'sha256'])
+PackageData.__new__.__defaults__ = (None,)
+
+
 class Versioning(LooseVersion):
     def __init__(self, vstring=None):
         self.full_vstring = vstring
@@ -84,6 +88,28 @@ class Versioning(LooseVersion):
         return 0
 
 
+class FileDigest():
+    """MD5, SHA-256 and size of a package file, computed in a single pass over its content."""
+
+    def __init__(self):
+        self._md5 = hashlib.md5()
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def update(self, chunk):
+        self._md5.update(chunk)
+        self._sha256.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def md5(self):
+        return self._md5.hexdigest()
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+
 class Checksum():
     SEPARATOR = ' *'
     CHUNK_SIZE = 64 * 1024
@@ -92,40 +118,14 @@ class Checksum():
         self.path = path
         self.md5file = path / '.md5'
 
-    def format(self, md5, name):
-        return ''.join([md5, self.SEPARATOR, str(name)])
-
     def digest(self, file):
-        md5hash = hashlib.md5()
+        digest = FileDigest()
         with file.open('rb') as f:
             chunk = f.read(self.CHUNK_SIZE)
             while chunk:
-                md5hash.update(chunk)
+                digest.update(chunk)
                 chunk = f.read(self.CHUNK_SIZE)
-        return md5hash.hexdigest()
-
-    def update(self, file, digest=None):
-        md5data = OrderedDict()
-
-        if self.md5file.exists():
-            with self.md5file.open('r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith(';') or not line:
-                        continue
-
-                    md5, _, name = line.partition(self.SEPARATOR)
-                    md5data[name] = md5
-
-        if digest is not None:
-            md5data[file.name] = digest
-        else:
-            md5data[file.name] = self.digest(file)
-
-        hashdata = [self.format(md5, name) for name, md5 in md5data.items()]
-
-        with self.md5file.open('w') as f:
-            f.write('\n'.join(hashdata))
+        return digest
 
     def iter(self):
         if not self.md5file.exists():
@@ -137,32 +137,23 @@ class Checksum():
                 if line.startswith(';') or not line:
                     continue
 
-                md5, _, name = line.partition(' *')
+                md5, _, name = line.partition(self.SEPARATOR)
                 yield md5, name
 
-    def iter_dir(self):
+    def iter_files(self):
+        """Iterate package file(s) of the directory, leaving out part and legacy metadata file(s)."""
         for file in self.path.iterdir():
-            if not file.is_file() or file.name in ['.cache', '.md5']:
+            if not file.is_file() or file.name in ['.cache', '.md5'] or file.suffix == '.part':
                 continue
 
-            md5 = self.digest(file)
-            name = file.relative_to(self.path)
+            yield file
 
-            yield md5, file
-
-    def write(self, digests=None, md5file=None):
-        if digests is None:
-            digests = []
-            for md5, file in self.iter_dir():
-                digests.append(self.format(md5, file.relative_to(self.path)))
-
-        if md5file is None:
-            md5file = self.md5file
-        else:
-            md5file = self.path / md5file
+    def iter_dir(self):
+        for file in self.iter_files():
+            digest = self.digest(file)
+            name = file.relative_to(self.path)
 
-        with md5file.open('w') as f:
-            f.write('\n'.join(digests))
+            yield digest, file
 
 
 class OrderedDictObj(OrderedDict):
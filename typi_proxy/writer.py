@@ -0,0 +1,168 @@
+"""
+Created on Oct 17, 2026
+
+@author: Azhar
+"""
+import os
+from collections import deque
+
+import tornado.ioloop
+from tornado.concurrent import Future
+from tornado.log import app_log
+
+# fsync on commit: none, the file, the file and its directory once published
+FSYNC_POLICIES = ('none', 'file', 'full')
+
+
+def get_file_mode():
+    """Mode a file created with ``open`` get under the process umask."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def fsync_directory(path):
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StreamWriter():
+    """Write chunk(s) of a stream to ``fd`` and update ``digests`` with them on the writer thread pool.
+
+    Chunk(s) and call(s) of a stream run one batch at a time, in the order they are given, so a
+    slow disk never block the IO loop. ``write`` return a future once more than ``pending``
+    byte(s) are in flight, the caller should wait for it before reading more of the stream.
+    ``on_written`` is called on the IO loop with the size of each batch once it is written.
+
+    The first error is kept, following write(s) and call(s) are dropped and their future fail
+    with it, ``close`` always run.
+    """
+
+    def __init__(self, executor, cfg, fd, digests=(), on_written=None):
+        self.executor = executor
+        self.cfg = cfg
+        self.fd = fd
+        self.digests = list(digests)
+        self.on_written = on_written
+
+        self.pending = 0
+        self.error = None
+
+        self._queue = deque()
+        self._running = False
+        self._waiters = []
+
+    def write(self, chunk):
+        self.pending += len(chunk)
+        self._queue.append((None, chunk, None, False))
+        self.next()
+        return self.wait()
+
+    def wait(self):
+        """Return ``None`` while there is room for more data, a future resolved once there is."""
+        if self.pending <= self.cfg['pending'] or self.error is not None:
+            return None
+
+        future = Future()
+        self._waiters.append(future)
+        return future
+
+    def call(self, fn, *args, always=False):
+        """Run ``fn(*args)`` on the pool after everything queued before, return a future of its result."""
+        future = Future()
+        self._queue.append((fn, args, future, always))
+        self.next()
+        return future
+
+    def drain(self):
+        """Return a future resolved once everything queued before is done, even after an error."""
+        return self.call(lambda: None, always=True)
+
+    def commit(self):
+        """Flush what is written to the file, and sync it to disk by the ``fsync`` policy."""
+        return self.call(self.sync)
+
+    def close(self):
+        return self.call(self.fd.close, always=True)
+
+    def sync(self):
+        if hasattr(self.fd, 'flush'):
+            self.fd.flush()
+        if self.cfg['fsync'] != 'none':
+            os.fsync(self.fd.fileno())
+
+    def published(self, path):
+        """Sync the directory ``path`` was renamed into, under the ``full`` policy."""
+        if self.cfg['fsync'] == 'full':
+            return self.call(fsync_directory, path.parent)
+        return None
+
+    def run(self, chunks):
+        size = 0
+        for chunk in chunks:
+            for digest in self.digests:
+                digest.update(chunk)
+            self.fd.write(chunk)
+            size += len(chunk)
+        return size
+
+    def next(self):
+        if self._running or not self._queue:
+            return
+
+        fn, args, future, always = self._queue.popleft()
+        if fn is None:
+            # every write waiting in line go in the same batch
+            chunks = [args]
+            while self._queue and self._queue[0][0] is None:
+                chunks.append(self._queue.popleft()[1])
+
+            if self.error is not None:
+                self.done(sum(len(chunk) for chunk in chunks), None, None)
+                return
+            fn, args = self.run, (chunks,)
+            size = sum(len(chunk) for chunk in chunks)
+        else:
+            size = 0
+            if self.error is not None and not always:
+                future.set_exception(self.error)
+                self.next()
+                return
+
+        self._running = True
+        tornado.ioloop.IOLoop.current().add_future(self.executor.submit(fn, *args),
+                                                   lambda result: self.done(size, future, result))
+
+    def done(self, size, future, result):
+        self._running = False
+
+        error = None
+        if result is not None:
+            try:
+                value = result.result()
+            except Exception as e:
+                error = e
+                if self.error is None:
+                    app_log.error('write to %s failed: %s', getattr(self.fd, 'name', self.fd), e)
+                    self.error = e
+
+        if size:
+            self.pending -= size
+            if error is None and result is not None and self.on_written is not None:
+                self.on_written(size)
+
+        if future is not None:
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+
+        if self.pending <= self.cfg['pending'] or self.error is not None:
+            waiters, self._waiters = self._waiters, []
+            for waiter in waiters:
+                waiter.set_result(None)
+
+        self.next()